@@ -0,0 +1,12 @@
+# uncompressed, memory-mappable copy of the cohort with dates as int16 day offsets,
+# written once and shared by the actions that read the cohort
+import sys
+
+from config import start_date
+
+sys.path.append("lib/")
+from cohort import *
+from profiling import *
+
+write_cohort_cache("output/input.feather", "output/cohort.arrow", start_date)
+write_profile("output/cohort.arrow")
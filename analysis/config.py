@@ -4,9 +4,48 @@ import pandas as pd
 start_date = pd.to_datetime("2020-02-01", format="%Y-%m-%d")
 end_date = pd.to_datetime("2021-11-28", format="%Y-%m-%d")
 
+# days at the end of the daily checkpoint that counts.py --incremental counts again,
+# for records coded some time after the day they are dated
+recount_days = 28
+
 # set minimum no of days between two events
 min_days = 21
 
 # set maximum number of events per patient
 n = 6
 m = 6
+
+# codelists extracted with n or m events per patient
+codelists_n = [
+    "exposure_to_disease",
+    "historic_covid",
+    "probable_covid_sequelae",
+    "probable_covid_pos_test",
+    "suspected_covid_isolation",
+    "suspected_covid_nonspecific",
+    "suspected_covid_had_antigen_test",
+    "sgss_positive_test",
+    "probable_covid_pos_test_snomed",
+]
+
+codelists_m = [
+    "antigen_negative",
+    "potential_historic_covid",
+    "suspected_covid_advice",
+    "suspected_covid_had_test",
+    "covid_unrelated_to_case_status",
+    "suspected_covid",
+    "probable_covid",
+]
+
+codelists = codelists_n + codelists_m
+
+# lower bounds of the age bands used for stratified counts
+age_bands = [0, 18, 30, 40, 50, 60, 70, 80]
+
+# lower bounds of the IMD rank quintiles used for stratified counts: ranks run from 1
+# (most deprived) to 32844, and a rank of 0 means the address is unknown
+imd_bands = [1, 6569, 13138, 19707, 26276]
+
+# characteristics the stratified counts are broken down by
+stratifications = ["region", "stp", "sex", "ageband", "imd"]
@@ -1,77 +1,163 @@
+import argparse
 import sys
 import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather
 
-from config import end_date, m, n, start_date
+from config import codelists, end_date, recount_days, start_date
 
 sys.path.append("lib/")
+from cache import *
+from cohort import *
+from disclosure import *
 from functions import *
+from parallel import *
+from profiling import *
 
-os.makedirs("output/caseness")
-# import data
-df = pd.read_feather("output/input.feather")
+# the event table is read one record batch at a time, so it is never held in memory whole
+events = "output/events.feather"
+# unredacted daily counts, kept so that a later run can count only the new days
+checkpoint = "output/caseness/codecounts_day.feather"
 
 # Make a dataframe with consecutive dates
 consec_dates = pd.DataFrame(
     index=pd.date_range(start=start_date, end=end_date, freq="D")
 )
 
-# choose only date variables
-activity_dates = df[[col for col in df.columns if col.endswith("_date")]]
-activity_dates.columns = activity_dates.columns.str.replace("_date", "X")
 
-# count code activity per day
-codecounts_day = activity_dates.apply(
-    lambda x: eventcountseries(event_dates=x, date_range=consec_dates)
-)
+def checkpoint_inputs():
+    # the checkpoint is reused only if it was counted with the same codelists, study
+    # definition and start date; the digest of these is stored in its schema metadata
+    return digest(
+        ["codelists", "analysis/study_definition.py"],
+        name=f"{start_date} {codelists}",
+    ).encode()
+
+
+def read_checkpoint():
+    # the checkpointed daily counts, or None if there are none from the same inputs
+    if not os.path.exists(checkpoint):
+        return None
+    table = pa.feather.read_table(checkpoint)
+    if (table.schema.metadata or {}).get(b"inputs") != checkpoint_inputs():
+        return None
+    previous = table.to_pandas().set_index("date").rename_axis(None)
+    if (
+        len(previous.index) == 0
+        or previous.index[0] != consec_dates.index[0]
+        or previous.columns.tolist() != codelists
+        or previous.index[-1] > consec_dates.index[-1]
+    ):
+        return None
+    return previous
+
+
+def write_checkpoint(codecounts_day):
+    table = pa.Table.from_pandas(
+        codecounts_day.rename_axis("date").reset_index(), preserve_index=False
+    )
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"inputs"] = checkpoint_inputs()
+    pa.feather.write_feather(table.replace_schema_metadata(metadata), checkpoint)
+
+
+def count_days(incremental=False, jobs=1):
+    # in incremental mode, reuse the checkpointed days up to its last recount_days,
+    # which are counted again with the new days to pick up records coded late;
+    # otherwise (or if the checkpoint is from other inputs) count everything
+    codecounts_checkpoint = pd.DataFrame(
+        index=consec_dates.index[:0], columns=codelists
+    )
+    if incremental:
+        previous = read_checkpoint()
+        if previous is not None:
+            keep = max(len(previous) - recount_days, 0)
+            codecounts_checkpoint = previous.iloc[:keep]
+    new_dates = consec_dates.iloc[len(codecounts_checkpoint.index) :]
+
+    # count code activity per day for each codelist, accumulating over record batches
+    # which are counted in parallel across jobs processes; each batch of the event table
+    # is sorted by day, so only its events from the first new day on are read
+    codecounts_day = pd.DataFrame(0, index=new_dates.index, columns=codelists)
+    if len(new_dates.index) > 0:
+        for counts in map_batches(
+            eventtablecounts,
+            events,
+            columns=["codelist", "day"],
+            jobs=jobs,
+            first_day=(new_dates.index[0] - start_date).days,
+            date_range=new_dates,
+            start_date=start_date,
+        ):
+            codecounts_day += counts.reindex(columns=codelists, fill_value=0)
+    return pd.concat([codecounts_checkpoint, codecounts_day]).astype(np.int64)
 
-# select the codelists with multiple events
-codelists_n = [
-    "exposure_to_disease",
-    "historic_covid",
-    "probable_covid_sequelae",
-    "probable_covid_pos_test",
-    "suspected_covid_isolation",
-    "suspected_covid_nonspecific",
-    "suspected_covid_had_antigen_test",
-    "sgss_positive_test",
-    "probable_covid_pos_test_snomed"
-]
-
-
-codelists_m = [
-    "antigen_negative",
-    "potential_historic_covid",
-    "suspected_covid_advice",
-    "suspected_covid_had_test",
-    "covid_unrelated_to_case_status",
-    "suspected_covid",
-    "probable_covid",
-]
-codelists = codelists_n + codelists_m
-
-# collapse multiple events into one for each codelist
-for list in codelists:
-    codecounts_day[list] = codecounts_day[
-        [col for col in codecounts_day.columns if col.startswith(f"{list}_X")]
-    ].sum(axis=1)
-
-codecounts_day.columns = codecounts_day.columns.str.strip("_X")
-codecounts_day = codecounts_day.filter(items=codelists)
-
-# derive count activity per week
-codecounts_week = codecounts_day.resample("W").sum()
-
-# small number redaction
-# cols = codecounts_week.columns.values.tolist()
-# for col in codelists:
-#     codecounts_week = redact_small_numbers_minimal(codecounts_week, col)
 
 def redact_round_table(df_in):
     """Redacts counts <= 5 and rounds counts to nearest 5"""
-    df_in = df_in.where(df_in > 5, np.nan).apply(lambda x: 5 * round(x / 5))
-    return df_in
-
-codecounts_week=redact_round_table(codecounts_week)
-
-codecounts_week.to_csv("output/caseness/codecounts_week.csv")
+    return disclosure_control(df_in, n=5, rounding="nearest5")
+
+
+# the script's body runs in main, so that the worker processes of --jobs can import
+# this module (as they must where processes are spawned rather than forked) without
+# running it again
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="count only the days after those in the daily checkpoint from a previous "
+        "run (and its last recount_days, see config.py)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes to count batches with",
+    )
+    args = parser.parse_args()
+
+    os.makedirs("output/caseness", exist_ok=True)
+
+    # the daily counts are cached under output/.cache, keyed by the contents of
+    # everything they depend on (of the event table, only the columns read), so a rerun
+    # with unchanged inputs goes straight to writing the outputs
+    # an incremental run skips the cache, whose key would read the whole event table:
+    # the checkpoint stands in for it
+    inputs = [
+        (events, ["codelist", "day"]),
+        "analysis/config.py",
+        "codelists",
+        "lib",
+        __file__,
+    ]
+    # run with ANALYSIS_PROFILE=1 to time each stage, written next to the weekly counts
+    with stage("count days"):
+        if args.incremental:
+            codecounts_day = count_days(incremental=True, jobs=args.jobs)
+        else:
+            codecounts_day = cached(
+                "codecounts_day", inputs, lambda: count_days(jobs=args.jobs)
+            )
+    with stage("write checkpoint"):
+        write_checkpoint(codecounts_day)
+
+    # derive count activity per week
+    with stage("weekly"):
+        codecounts_week = sumperiods(codecounts_day, "W")
+
+    # small number redaction
+    # cols = codecounts_week.columns.values.tolist()
+    # for col in codelists:
+    #     codecounts_week = redact_small_numbers_minimal(codecounts_week, col)
+
+    with stage("redact"):
+        codecounts_week=redact_round_table(codecounts_week)
+
+    codecounts_week.to_csv("output/caseness/codecounts_week.csv")
+    write_profile("output/caseness/codecounts_week.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# weekly code counts broken down by region, stp, sex, age band and imd
+import os
+import sys
+
+import pandas as pd
+
+from config import (
+    age_bands,
+    codelists,
+    end_date,
+    imd_bands,
+    start_date,
+    stratifications,
+)
+
+sys.path.append("lib/")
+from cohort import *
+from disclosure import *
+from functions import *
+from profiling import *
+
+os.makedirs("output/caseness", exist_ok=True)
+cohort = "output/cohort.arrow"
+events = "output/events.feather"
+
+# Make a dataframe with consecutive dates
+consec_dates = pd.DataFrame(
+    index=pd.date_range(start=start_date, end=end_date, freq="D")
+)
+
+# patient characteristics, one row per cohort row, held as categoricals; patients with
+# a characteristic missing are counted in a "missing" stratum, so that the strata of
+# every stratification add up to the national counts
+# ages are banded by age_bands and IMD ranks into quintiles by imd_bands (see config.py)
+characteristics = [col for col in stratifications if col != "ageband"]
+if "ageband" in stratifications:
+    characteristics.append("age")
+# run with ANALYSIS_PROFILE=1 to time each stage (see lib/profiling.py)
+with stage("read strata"):
+    strata = []
+    for batch in iter_cohort(cohort, columns=characteristics):
+        if "ageband" in stratifications:
+            batch["ageband"] = ageband(batch.pop("age"), age_bands)
+        if "imd" in stratifications:
+            batch["imd"] = imdband(batch["imd"], imd_bands)
+        strata.append(
+            batch.astype(str).where(batch.notna(), "missing").astype("category")
+        )
+    strata = pd.DataFrame(
+        {
+            col: pd.api.types.union_categoricals(
+                [batch[col] for batch in strata], sort_categories=True
+            )
+            for col in stratifications
+        }
+    )
+
+# count code activity per stratum and day for every stratification, accumulating
+# over record batches of the event table
+codecounts_day = {
+    col: pd.DataFrame(
+        0,
+        index=pd.MultiIndex.from_product(
+            [strata[col].cat.categories, consec_dates.index], names=[col, "date"]
+        ),
+        columns=codelists,
+    )
+    for col in stratifications
+}
+with stage("count days"):
+    for batch in iter_cohort(events, columns=["patient_row", "codelist", "day"]):
+        for col in stratifications:
+            codecounts_day[col] += eventtablecounts(
+                batch, date_range=consec_dates, groups=strata[col]
+            ).reindex(columns=codelists, fill_value=0)
+
+# derive count activity per week, redact, and write one long table per stratification
+for col, counts in codecounts_day.items():
+    with stage(f"weekly {col}"):
+        codecounts_week = counts.groupby(
+            [pd.Grouper(level=col), pd.Grouper(level="date", freq="W")]
+        ).sum()
+        codecounts_week = disclosure_control(codecounts_week, n=5, rounding="nearest5")
+        codecounts_week = (
+            codecounts_week.rename_axis([col, "week"])
+            .reset_index()
+            .melt(id_vars=[col, "week"], var_name="codelist", value_name="count")
+        )
+        codecounts_week.to_csv(
+            f"output/caseness/codecounts_week_{col}.csv", index=False
+        )
+# one profile covers every stratification, so it is named after the script
+write_profile("output/caseness/counts_stratified")
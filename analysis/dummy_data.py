@@ -0,0 +1,51 @@
+# dummy output/input.feather from the study definition's return_expectations, for
+# running (and timing) the later actions on cohorts larger than cohortextractor's
+# dummy data generator can make
+import argparse
+import sys
+
+sys.path.append("lib/")
+from dummy import *
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--population-size",
+        type=int,
+        default=10000,
+        help="number of patients to generate",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=250_000,
+        help="number of patients to generate and write at a time",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes to generate chunks with",
+    )
+    parser.add_argument(
+        "--study-definition",
+        default="analysis/study_definition.py",
+        help="study definition to read the expectations from",
+    )
+    parser.add_argument("--output", default="output/input.feather")
+    args = parser.parse_args()
+
+    write_dummy_cohort(
+        read_study_definition(args.study_definition),
+        args.output,
+        args.population_size,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+        jobs=args.jobs,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+# sparse long event table: one row per recorded {codelist}_X{i}_date event,
+# built once from the wide cohort and read by the downstream actions
+import sys
+
+from config import start_date
+
+sys.path.append("lib/")
+from cohort import *
+from profiling import *
+
+write_event_table("output/cohort.arrow", "output/events.feather", start_date)
+write_profile("output/events.feather")
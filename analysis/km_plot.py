@@ -1,154 +1,264 @@
 # figure 2 KM
+import argparse
 import sys
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-from config import n
+from config import start_date
 
 sys.path.append("lib/")
+from bootstrap import *
+from cache import *
+from cohort import *
 from functions import *
-from statsmodels.nonparametric.smoothers_lowess import lowess
-
-# import data
-df = pd.read_feather("output/input.feather")
-
-# derive start/end dates
-df["start_date"] = df[[col for col in df.columns if col.endswith("_date")]].min().min()
-df["end_date"] = df[[col for col in df.columns if col.endswith("_date")]].max().max()
-
-# derive time-to-event censoring info
-
-# death date or last date of follow up
-df["date_event"] = np.where(
-    df["date_died_ons"] <= df["end_date"], df["date_died_ons"], df["end_date"]
-)
-
-# censoring indiators
-df["indicator_death"] = np.where(
-    (df["date_died_ons"] <= df["end_date"]) & (df["died_ons"] == 1), 1, 0
-)
-df["indicator_death_covid"] = np.where(
-    (df["date_died_ons"] <= df["end_date"]) & (df["died_ons_covid"] == 1), 1, 0
-)
-df["indicator_death_noncovid"] = np.where(
-    (df["date_died_ons"] <= df["end_date"]) & (df["died_ons_noncovid"] == 1), 1, 0
-)
-
-# censor death category if end date exceeds last date
-df["death_category"] = np.where(
-    df["date_died_ons"] <= df["end_date"], df["death_category"], "alive"
-)
-
-# list occurances of +ve SGSS tests and proabable +ve covid tests
-pos_tests = ["probable_covid_pos_test", "sgss_positive_test"]
-df_pos_tests = pd.DataFrame(np.nan, index=range(1, n + 1), columns=pos_tests)
-for list in pos_tests:
-    for i in range(1, n + 1):
-        df_pos_tests[list][i] = f"{list}_X{i}_date"
-
-## positive test as indicated in SGSS or in primary care
-df_pvetestPC = pd.melt(
-    df,
-    id_vars=[
-        "date_event",
-        "indicator_death",
-        "indicator_death_covid",
-        "indicator_death_noncovid",
-    ],
-    value_name="date_probable_covid_pos_test",
-    value_vars=df_pos_tests["probable_covid_pos_test"],
-)
-df_pvetestSGSS = pd.melt(
-    df,
-    id_vars=[
-        "date_event",
-        "indicator_death",
-        "indicator_death_covid",
-        "indicator_death_noncovid",
-    ],
-    value_name="date_sgss_positive_test",
-    value_vars=df_pos_tests["sgss_positive_test"],
-)
-
-# derive time-to-death from positive test date
-df_pvetestSGSS["pvetestSGSS_to_death"] = (
-    df_pvetestSGSS["date_event"] - df_pvetestSGSS["date_sgss_positive_test"]
-).astype("timedelta64[D]")
-df_pvetestPC["pvetestPC_to_death"] = (
-    df_pvetestPC["date_event"] - df_pvetestPC["date_probable_covid_pos_test"]
-).astype("timedelta64[D]")
-
-## remove those without a positive test
-df_pvetestSGSS = df_pvetestSGSS[~np.isnan(df_pvetestSGSS["date_sgss_positive_test"])]
-df_pvetestPC = df_pvetestPC[~np.isnan(df_pvetestPC["date_probable_covid_pos_test"])]
-
-fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(10, 5), sharey=True)
-
-# SGSS pos test to death
-
-kmdata = KMestimate(
-    df_pvetestSGSS["pvetestSGSS_to_death"], df_pvetestSGSS["indicator_death"]
-)
-kmdata_covid = KMestimate(
-    df_pvetestSGSS["pvetestSGSS_to_death"], df_pvetestSGSS["indicator_death_covid"]
-)
-kmdata_noncovid = KMestimate(
-    df_pvetestSGSS["pvetestSGSS_to_death"], df_pvetestSGSS["indicator_death_noncovid"]
-)
-
-# add smoothing
+from parallel import *
+from profiling import *
+from smoothing import *
+
+cohort = "output/cohort.arrow"
+events = "output/events.feather"
+
+# covid and non-covid deaths compete: each is plotted as its cumulative incidence, with
+# the other as a competing cause of death rather than as censoring
+causes = ["covid-death", "non-covid-death"]
+
+# the curves are plotted up to xmax days, smoothed over bandwidth days either side (about
+# the 17-point window of the lowess with frac=0.025 used before, over ~660 days)
+xmax = 80
+bandwidth = 8
+
+
+def estimate_curves(bootstrap=0, jobs=1):
+    # positive tests are read from the event table; only the death outcomes are read
+    # from the cohort, one row per patient with dates as int16 days since start_date
+    with stage("read cohort"):
+        df = pd.concat(
+            [
+                to_dayoffsets(batch, start_date)
+                for batch in iter_cohort(
+                    cohort, columns=["date_died_ons", "death_category"]
+                )
+            ],
+            ignore_index=True,
+        )
+
+    # derive end date: the last event date recorded anywhere in the cohort
+    with stage("end date"):
+        end_day = max(
+            batch["day"].max() for batch in iter_cohort(events, columns=["day"])
+        )
+
+    # derive time-to-event censoring info
+    died = df["date_died_ons"].to_numpy()
+    died_by_end = (died != MISSING_DAY) & (died <= end_day)
+
+    # death date or last date of follow up
+    df["date_event"] = np.where(died_by_end, died, end_day).astype(np.int32)
+
+    # cause of death from death_category, or missing where censored; held with every
+    # cause as a category, so that each has a curve even with no deaths from it
+    df["cause"] = pd.Categorical(
+        df["death_category"].where(died_by_end & (df["death_category"] != "alive")),
+        categories=causes + ["unknown"],
+    )
+
+    ## positive test as indicated in SGSS or in primary care: one row per test, with the
+    ## time-to-death from it, accumulated over record batches of the event table
+    pvetestSGSS = []
+    pvetestPC = []
+    with stage("positive tests"):
+        for batch in iter_cohort(events, columns=["patient_row", "codelist", "day"]):
+            for list, name, pvetests in [
+                ("sgss_positive_test", "pvetestSGSS_to_death", pvetestSGSS),
+                ("probable_covid_pos_test", "pvetestPC_to_death", pvetestPC),
+            ]:
+                tests = batch[batch["codelist"] == list]
+                rows = tests["patient_row"].to_numpy()
+                pvetest = df.loc[rows, ["cause"]].reset_index(drop=True)
+                pvetest.insert(
+                    0, name, df["date_event"].to_numpy()[rows] - tests["day"].to_numpy()
+                )
+                pvetests.append(pvetest)
+
+        df_pvetestSGSS = pd.concat(pvetestSGSS, ignore_index=True)
+        df_pvetestPC = pd.concat(pvetestPC, ignore_index=True)
+
+    # the SGSS and primary care curves are independent, so are estimated in parallel
+    # across the jobs processes, with the causes passed as their codes; times are whole
+    # days, so are counted per day, and only up to the last day that the plotted
+    # (smoothed) curves depend on; every cause is estimated in one pass
+    tasks = [
+        (
+            df_pvetestSGSS["pvetestSGSS_to_death"].to_numpy(),
+            df_pvetestSGSS["cause"].cat.codes.to_numpy(),
+        ),
+        (
+            df_pvetestPC["pvetestPC_to_death"].to_numpy(),
+            df_pvetestPC["cause"].cat.codes.to_numpy(),
+        ),
+    ]
+    with stage("CIFestimate"):
+        kmdata = map_shared(
+            CIFestimate,
+            tasks,
+            jobs=jobs,
+            horizon=xmax + bandwidth,
+            categories=causes + ["unknown"],
+        )
+
+    # confidence limits from bootstrap replicates, which are estimated across the jobs
+    # processes (none with bootstrap = 0)
+    if bootstrap > 0:
+        with stage("bootstrap"):
+            for curves, (times, codes) in zip(kmdata, tasks):
+                limits = CIFbootstrap(
+                    times,
+                    codes,
+                    xmax + bandwidth,
+                    replicates=bootstrap,
+                    ci=0.95,
+                    jobs=jobs,
+                    categories=causes + ["unknown"],
+                )
+                curves[["lower", "upper"]] = limits[["lower", "upper"]].to_numpy()
+    return kmdata
+
+
+# add smoothing: a local-linear kernel over the days up to the end of the plot, which
+# keeps the survival curves (and their confidence limits) non-increasing
+@profiled()
 def smoothing(df):
-    x = df["times"]
-    y1 = df["kmestimate"]
-    smooth = lowess(y1, x, is_sorted=True, frac=0.025, it=0)
-    df["kmestimate"] = smooth[:, 1]
-
-
-smoothing(kmdata_covid)
-smoothing(kmdata_noncovid)
-
-axes[0].plot(
-    kmdata_covid["times"], 1 - kmdata_covid["kmestimate"], label="covid deaths"
-)
-axes[0].plot(
-    kmdata_noncovid["times"],
-    1 - kmdata_noncovid["kmestimate"],
-    label="non-covid deaths",
-)
-axes[0].set_xlabel("Days")
-axes[0].set_ylabel("1 - KM survival estimate")
-axes[0].set_title("as identified from SGSS data\n")
-axes[0].legend()
-axes[0].set_xlim(0, 80)
-
-# PC pos test to death
-kmdata = KMestimate(df_pvetestPC["pvetestPC_to_death"], df_pvetestPC["indicator_death"])
-kmdata_covid = KMestimate(
-    df_pvetestPC["pvetestPC_to_death"], df_pvetestPC["indicator_death_covid"]
-)
-kmdata_noncovid = KMestimate(
-    df_pvetestPC["pvetestPC_to_death"], df_pvetestPC["indicator_death_noncovid"]
-)
-
-# add smoothing
-smoothing(kmdata_covid)
-smoothing(kmdata_noncovid)
-
-axes[1].plot(
-    kmdata_covid["times"], 1 - kmdata_covid["kmestimate"], label="covid deaths"
-)
-axes[1].plot(
-    kmdata_noncovid["times"],
-    1 - kmdata_noncovid["kmestimate"],
-    label="non-covid deaths",
-)
-axes[1].set_xlabel("Days")
-axes[1].set_ylabel("1 - KM survival estimate")
-axes[1].set_title("as identified from primary care data\n")
-axes[1].set_xlim(0, 80)
-
-fig.suptitle("Days from positive test to death", y=1.05, fontsize=14)
-fig.tight_layout()
-fig.savefig("output/figs.svg")
+    smooth = {}
+    for col in ["kmestimate", "lower", "upper"]:
+        if col not in df:
+            continue
+        days, smooth[col] = smoothcurve(
+            df["times"], df[col], bandwidth, first=0, last=xmax + bandwidth
+        )
+    return pd.DataFrame({"times": days, **smooth})
+
+
+# the worker processes of --jobs import this module where processes are spawned, so
+# nothing is estimated or plotted on import
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes to estimate the curves, and then their bootstrap "
+        "replicates, with",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=200,
+        help="number of bootstrap replicates for the confidence intervals (0 for none)",
+    )
+    args = parser.parse_args()
+
+    # the curves are cached under output/.cache, keyed by the contents of everything
+    # they depend on (of the cohort and event table, only the columns read), so a rerun
+    # with unchanged inputs (e.g. to restyle the plot) goes straight to plotting
+    # run with ANALYSIS_PROFILE=1 to time each stage, written to
+    # output/figs.profile.json
+    with stage("kmdata"):
+        kmdata_SGSS, kmdata_PC = cached(
+            f"kmdata-bootstrap{args.bootstrap}",
+            [
+                (cohort, ["date_died_ons", "death_category"]),
+                (events, ["patient_row", "codelist", "day"]),
+                "analysis/config.py",
+                "codelists",
+                "lib",
+                __file__,
+            ],
+            lambda: estimate_curves(bootstrap=args.bootstrap, jobs=args.jobs),
+        )
+
+    fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(10, 5), sharey=True)
+
+    # SGSS pos test to death
+
+    kmdata_all = kmdata_SGSS
+    kmdata_covid, kmdata_noncovid = [
+        kmdata_all[kmdata_all["outcome"] == cause].reset_index(drop=True)
+        for cause in causes
+    ]
+
+    kmdata_covid = smoothing(kmdata_covid)
+    kmdata_noncovid = smoothing(kmdata_noncovid)
+
+    axes[0].plot(
+        kmdata_covid["times"], 1 - kmdata_covid["kmestimate"], label="covid deaths"
+    )
+    axes[0].plot(
+        kmdata_noncovid["times"],
+        1 - kmdata_noncovid["kmestimate"],
+        label="non-covid deaths",
+    )
+    # 95% confidence intervals
+    for kmdata, color in [(kmdata_covid, "C0"), (kmdata_noncovid, "C1")]:
+        if "lower" not in kmdata:
+            continue
+        axes[0].fill_between(
+            kmdata["times"],
+            1 - kmdata["upper"],
+            1 - kmdata["lower"],
+            color=color,
+            alpha=0.2,
+            linewidth=0,
+        )
+    axes[0].set_xlabel("Days")
+    axes[0].set_ylabel("cumulative incidence of death")
+    axes[0].set_title("as identified from SGSS data\n")
+    axes[0].legend()
+    axes[0].set_xlim(0, xmax)
+
+    # PC pos test to death
+    kmdata_all = kmdata_PC
+    kmdata_covid, kmdata_noncovid = [
+        kmdata_all[kmdata_all["outcome"] == cause].reset_index(drop=True)
+        for cause in causes
+    ]
+
+    # add smoothing
+    kmdata_covid = smoothing(kmdata_covid)
+    kmdata_noncovid = smoothing(kmdata_noncovid)
+
+    axes[1].plot(
+        kmdata_covid["times"], 1 - kmdata_covid["kmestimate"], label="covid deaths"
+    )
+    axes[1].plot(
+        kmdata_noncovid["times"],
+        1 - kmdata_noncovid["kmestimate"],
+        label="non-covid deaths",
+    )
+    # 95% confidence intervals
+    for kmdata, color in [(kmdata_covid, "C0"), (kmdata_noncovid, "C1")]:
+        if "lower" not in kmdata:
+            continue
+        axes[1].fill_between(
+            kmdata["times"],
+            1 - kmdata["upper"],
+            1 - kmdata["lower"],
+            color=color,
+            alpha=0.2,
+            linewidth=0,
+        )
+    axes[1].set_xlabel("Days")
+    axes[1].set_ylabel("cumulative incidence of death")
+    axes[1].set_title("as identified from primary care data\n")
+    axes[1].set_xlim(0, xmax)
+
+    fig.suptitle("Days from positive test to death", y=1.05, fontsize=14)
+    fig.tight_layout()
+    with stage("savefig"):
+        fig.savefig("output/figs.svg")
+    write_profile("output/figs.svg")
+
+
+if __name__ == "__main__":
+    main()
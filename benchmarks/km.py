@@ -0,0 +1,112 @@
+"""Compare the vectorised KMestimate against the original row-by-row loop.
+
+Run from the repository root:
+
+    python benchmarks/km.py
+    python benchmarks/km.py --sizes 10000 1000000
+
+Each size is timed for both implementations on the same synthetic
+time-to-death data and the two outputs are checked for agreement.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append("lib/")
+from functions import KMestimate
+
+
+def KMestimate_loop(times, indicators):
+    # the original implementation, kept here as the reference for timings
+    # and for checking that the vectorised version gives the same frame
+    times = np.array(times)
+    indicators = np.array(indicators)
+    sortinds = times.argsort()
+    times = times[sortinds]
+    indicators = indicators[sortinds]
+
+    atrisk0 = len(times)
+
+    unq_times, counts = np.unique(times, return_counts=True)
+    event_times, event_counts = np.unique(times[indicators == 1], return_counts=True)
+    censor_times, censor_counts = np.unique(times[indicators == 0], return_counts=True)
+
+    cml_counts = counts.cumsum()
+    atrisk = (atrisk0 - cml_counts) + counts
+
+    kmdata = (
+        pd.DataFrame({"times": unq_times, "atrisk": atrisk})
+        .merge(
+            pd.DataFrame({"times": event_times, "died": event_counts}),
+            on="times",
+            how="left",
+        )
+        .merge(
+            pd.DataFrame({"times": censor_times, "censored": censor_counts}),
+            on="times",
+            how="left",
+        )
+    )
+
+    kmdata[["died", "censored"]] = kmdata[["died", "censored"]].fillna(0)
+
+    kmdata["kmestimate"] = 1.0
+    for i in kmdata.index:
+        if i == 0:
+            kmdata.loc[i, "kmestimate"] = (
+                1
+                * (kmdata.loc[i, "atrisk"] - kmdata.loc[i, "died"])
+                / kmdata.loc[i, "atrisk"]
+            )
+        else:
+            kmdata.loc[i, "kmestimate"] = (
+                kmdata.loc[i - 1, "kmestimate"]
+                * (kmdata.loc[i, "atrisk"] - kmdata.loc[i, "died"])
+                / kmdata.loc[i, "atrisk"]
+            )
+
+    return kmdata
+
+
+def synthetic_times(size, seed=0):
+    # whole-day follow-up times as produced in km_plot.py, with ~10% deaths
+    rng = np.random.default_rng(seed)
+    times = rng.integers(0, 660, size=size).astype(float)
+    indicators = (rng.random(size) < 0.1).astype(int)
+    return times, indicators
+
+
+def timeit(func, *args, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>12} {'loop (s)':>10} {'vector (s)':>11} {'speedup':>8}")
+    for size in args.sizes:
+        times, indicators = synthetic_times(size)
+        t_loop, expected = timeit(
+            KMestimate_loop, times, indicators, repeat=args.repeat
+        )
+        t_vec, result = timeit(KMestimate, times, indicators, repeat=args.repeat)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+        print(f"{size:>12,} {t_loop:>10.3f} {t_vec:>11.3f} {t_loop / t_vec:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Time the scaling-critical functions and pipeline actions on synthetic cohorts.
+
+Run from the repository root:
+
+    python benchmarks/suite.py --save
+    python benchmarks/suite.py
+    python benchmarks/suite.py --sizes 10000 100000 --cases KMestimate counts
+
+Each case runs in its own process, so that its peak RSS is its own, on a
+dummy cohort from lib/dummy.py of each size. The pipeline cases run the
+action scripts in turn (cache_cohort, event_table, counts, km_plot) in a
+scratch copy of the project layout. Wall time (the best of --repeat runs for
+the function cases, one run for the pipeline cases) and peak RSS are compared
+against the stored baseline, and any case slower or larger than the baseline
+by more than the tolerances is flagged as a regression, with exit status 1.
+--save replaces the baseline with the current results.
+"""
+
+import argparse
+import json
+import os
+import re
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append("lib/")
+sys.path.append("analysis/")
+
+FUNCTIONS = ["eventcountseries", "KMestimate", "redact_small_numbers"]
+# in the order they have to run in
+PIPELINE = ["cache_cohort", "event_table", "counts", "km_plot"]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def best_of(func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def function_case(case, size, workspace, repeat):
+    from functions import KMestimate, eventcountseries, redact_small_numbers
+
+    rng = np.random.default_rng(0)
+    if case == "eventcountseries":
+        from cohort import cohort_columns, iter_cohort
+        from config import end_date, start_date
+
+        path = os.path.join(workspace, "output/input.feather")
+        columns = [
+            col
+            for col in cohort_columns(path)
+            if re.fullmatch(r"sgss_positive_test_X\d+_date", col)
+        ]
+        event_dates = pd.concat(iter_cohort(path, columns=columns), ignore_index=True)
+        date_range = pd.DataFrame(
+            index=pd.date_range(start=start_date, end=end_date, freq="D")
+        )
+        return best_of(
+            lambda: event_dates.apply(
+                lambda x: eventcountseries(event_dates=x, date_range=date_range)
+            ),
+            repeat,
+        )
+    if case == "KMestimate":
+        # whole-day follow-up times as in km_plot.py, with ~10% deaths
+        times = rng.integers(0, 660, size=size).astype(float)
+        indicators = (rng.random(size) < 0.1).astype(int)
+        return best_of(lambda: KMestimate(times, indicators), repeat)
+    if case == "redact_small_numbers":
+        # small counts in strata of about 100 rows
+        df = pd.DataFrame(
+            {
+                "stratum": rng.integers(0, max(size // 100, 1), size=size),
+                "count": rng.poisson(20, size=size),
+            }
+        )
+        return best_of(
+            lambda: redact_small_numbers(df, 5, "count", by="stratum"), repeat
+        )
+    raise ValueError(f"unknown case {case}")
+
+
+def pipeline_case(case, workspace):
+    # run the action script as `python analysis/<case>.py` would, from the workspace
+    os.chdir(workspace)
+    sys.argv = [f"analysis/{case}.py"]
+    start = time.perf_counter()
+    runpy.run_path(sys.argv[0], run_name="__main__")
+    return time.perf_counter() - start
+
+
+def make_workspace(size, seed):
+    # a scratch project: the repository's code linked in, with its own output/ holding
+    # a dummy input.feather
+    from dummy import read_study_definition, write_dummy_cohort
+
+    workspace = tempfile.mkdtemp(prefix=f"benchmark-{size}-")
+    for name in ["analysis", "lib", "codelists"]:
+        os.symlink(os.path.abspath(name), os.path.join(workspace, name))
+    os.makedirs(os.path.join(workspace, "output"))
+    write_dummy_cohort(
+        read_study_definition(),
+        os.path.join(workspace, "output/input.feather"),
+        size,
+        seed=seed,
+    )
+    return workspace
+
+
+def run_case(case, size, workspace, repeat):
+    # run one case in a fresh process, returning its {"seconds", "peak_rss_mb"}
+    command = [sys.executable, os.path.abspath(__file__), "--child", case]
+    command += ["--sizes", str(size), "--workspace", workspace]
+    command += ["--repeat", str(repeat)]
+    env = dict(os.environ, MPLBACKEND="Agg")
+    output = subprocess.run(
+        command, check=True, stdout=subprocess.PIPE, env=env, text=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def compare(results, baseline, time_tolerance, rss_tolerance):
+    # print results against the baseline, returning the number of regressions
+    regressions = 0
+    print(
+        f"{'case':<22} {'rows':>10} {'time (s)':>9} {'vs base':>8}"
+        f" {'peak RSS (MB)':>14} {'vs base':>8}"
+    )
+    for case, sizes in results.items():
+        for size, result in sizes.items():
+            base = baseline.get(case, {}).get(size)
+            line = f"{case:<22} {int(size):>10,} {result['seconds']:>9.3f}"
+            if base is None:
+                print(f"{line} {'':>8} {result['peak_rss_mb']:>14.0f}")
+                continue
+            time_ratio = result["seconds"] / base["seconds"]
+            rss_ratio = result["peak_rss_mb"] / base["peak_rss_mb"]
+            line += f" {time_ratio:>7.2f}x {result['peak_rss_mb']:>14.0f} {rss_ratio:>7.2f}x"
+            if time_ratio > 1 + time_tolerance or rss_ratio > 1 + rss_tolerance:
+                line += "  REGRESSION"
+                regressions += 1
+            print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument(
+        "--cases", nargs="+", default=FUNCTIONS + PIPELINE, choices=FUNCTIONS + PIPELINE
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default="benchmarks/baseline.json")
+    parser.add_argument(
+        "--time-tolerance",
+        type=float,
+        default=0.2,
+        help="fraction slower than the baseline that counts as a regression",
+    )
+    parser.add_argument(
+        "--rss-tolerance",
+        type=float,
+        default=0.2,
+        help="fraction more peak RSS than the baseline that counts as a regression",
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="save results as the baseline"
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--workspace", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        if args.child in PIPELINE:
+            seconds = pipeline_case(args.child, args.workspace)
+        else:
+            seconds = function_case(
+                args.child, args.sizes[0], args.workspace, args.repeat
+            )
+        print(json.dumps({"seconds": seconds, "peak_rss_mb": peak_rss_mb()}))
+        return
+
+    results = {case: {} for case in args.cases}
+    for size in args.sizes:
+        workspace = make_workspace(size, args.seed)
+        try:
+            # the cohort cache and event table are needed by the later pipeline cases,
+            # whether or not they are being timed
+            for case in FUNCTIONS + PIPELINE:
+                if case in args.cases:
+                    results[case][str(size)] = run_case(
+                        case, size, workspace, args.repeat
+                    )
+                elif case in PIPELINE[:2] and set(args.cases) & set(PIPELINE):
+                    run_case(case, size, workspace, 1)
+        finally:
+            shutil.rmtree(workspace)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.time_tolerance, args.rss_tolerance)
+
+    if args.save:
+        for case, sizes in results.items():
+            baseline.setdefault(case, {}).update(sizes)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"saved {args.baseline}")
+    elif regressions:
+        sys.exit(f"{regressions} regression(s) against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+from functions import _causecodes
+from parallel import map_shared
+
+
+def _replicate_incidence(draws, ndays, ncauses, observed):
+    # 1 - cumulative incidence of each cause (see functions.CIFestimate) for bootstrap
+    # replicates, from their counts per (day, cause) cell, with censoring as cause 0
+    # returns an array of replicates x causes x observed days
+    counts = draws.reshape(len(draws), ndays, ncauses + 1)
+    total = counts.sum(axis=2)
+    atrisk = total.sum(axis=1, keepdims=True) - total.cumsum(axis=1) + total
+    died = counts[:, :, 1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hazard = np.where(atrisk[:, :, None] > 0, died / atrisk[:, :, None], 0.0)
+    survival = np.cumprod(1 - hazard.sum(axis=2), axis=1)
+    before = np.concatenate([np.ones((len(draws), 1)), survival[:, :-1]], axis=1)
+    incidence = np.cumsum(before[:, :, None] * hazard, axis=1)
+    return (1 - incidence[:, observed]).transpose(0, 2, 1)
+
+
+def CIFbootstrap(
+    times, causes, horizon, replicates=200, ci=0.95, jobs=1, seed=0, categories=None
+):
+    # to bootstrap confidence limits for the cumulative incidence of competing causes
+    # of whole-day times up to horizon (see functions.CIFestimate): "lower" and "upper"
+    # percentile limits of 1 - cumulative incidence, on the same rows as CIFestimate,
+    # labelled by outcome (the cause) and times
+    # the curves depend only on the number of observations in each (day, cause) cell,
+    # so resampling the observations is drawing those counts from a multinomial: every
+    # replicate is drawn at once as one replicates x cells matrix, whose size depends on
+    # the horizon and number of causes rather than the number of observations; the
+    # replicates' curves are then estimated across jobs processes
+    # causes can be a categorical, or codes of categories, as for CIFestimate
+    times = np.asarray(times).astype(np.int64)
+    codes, labels = _causecodes(causes, categories)
+    ncauses = len(labels)
+
+    first = min(times.min(), 0) if times.size else 0
+    days = np.minimum(times - first, horizon - first + 1)
+    ndays = horizon - first + 2
+    cells = np.bincount(
+        days * (ncauses + 1) + codes + 1, minlength=ndays * (ncauses + 1)
+    )
+    observed = np.flatnonzero(cells.reshape(ndays, -1).sum(axis=1)[:-1])
+
+    return _bootstrap(
+        _replicate_incidence,
+        cells,
+        observed,
+        observed + first,
+        labels,
+        replicates,
+        ci,
+        jobs,
+        seed,
+        ndays=ndays,
+        ncauses=ncauses,
+    )
+
+
+def _bootstrap(
+    replicate, cells, observed, times, outcomes, replicates, ci, jobs, seed, **kwargs
+):
+    # draws every replicate's cell counts at once, as one multinomial matrix, and runs
+    # replicate (returning replicates x outcomes x observed days) on them across jobs
+    # processes, returning the percentile limits in a long frame
+    if replicates < 1:
+        raise ValueError(f"replicates must be at least 1, not {replicates}")
+    total = cells.sum()
+    rng = np.random.default_rng(seed)
+    draws = rng.multinomial(total, cells / max(total, 1), size=replicates)
+    curves = np.concatenate(
+        map_shared(
+            replicate,
+            [(chunk,) for chunk in np.array_split(draws, jobs) if len(chunk)],
+            jobs=jobs,
+            observed=observed,
+            **kwargs,
+        )
+    )
+
+    lower, upper = np.quantile(curves, [(1 - ci) / 2, (1 + ci) / 2], axis=0)
+    limits = [
+        pd.DataFrame(
+            {"outcome": outcome, "times": times, "lower": lower[j], "upper": upper[j]}
+        )
+        for j, outcome in enumerate(outcomes)
+    ]
+    if not limits:
+        return pd.DataFrame(columns=["outcome", "times", "lower", "upper"])
+    return pd.concat(limits, ignore_index=True)
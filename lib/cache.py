@@ -0,0 +1,104 @@
+import hashlib
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from cohort import open_cohort
+
+
+def digest(paths, name=""):
+    # to hash the contents of files, and of every file under directories, together with
+    # name; caches, hidden files and the paths' modification times are ignored, so the
+    # hash changes only when content does
+    # a path can also be a (path, columns) pair for a feather (Arrow IPC) file, to hash
+    # only those columns (see columndigest) rather than the whole file
+    hasher = hashlib.sha256(name.encode())
+    files = []
+    for path in paths:
+        if isinstance(path, tuple):
+            files.append(path)
+        elif os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith((".", "__")))
+                files.extend(
+                    os.path.join(root, f)
+                    for f in sorted(names)
+                    if not f.startswith(".")
+                )
+        else:
+            files.append(path)
+
+    for path in files:
+        if isinstance(path, tuple):
+            columndigest(hasher, *path)
+            continue
+        hasher.update(path.encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def columndigest(hasher, path, columns):
+    # to add the named columns of a feather (Arrow IPC) file to a hash: their types and
+    # the buffers of every record batch, read through the same column projection as
+    # iter_cohort, so the rest of the file is never read
+    hasher.update(path.encode())
+    with pa.memory_map(path) as source:
+        reader = open_cohort(source, columns=columns)
+        hasher.update(str(reader.schema).encode())
+        for i in range(reader.num_record_batches):
+            for column in reader.get_batch(i).columns:
+                for buffer in column.buffers():
+                    hasher.update(b"" if buffer is None else memoryview(buffer))
+
+
+def evict(cache_dir, max_bytes):
+    # to delete the least recently used entries of a cache until it holds <= max_bytes
+    # other actions can be using the cache at the same time: their entries still being
+    # written (*.tmp) are left alone, and entries they evict first are skipped
+    entries = []
+    for f in os.listdir(cache_dir):
+        if f.endswith(".tmp"):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_dir, f))
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, os.path.join(cache_dir, f)))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def cached(name, inputs, compute, cache_dir="output/.cache", max_bytes=2**30):
+    # to return compute(), or the result of an earlier call with the same name and inputs
+    # results (any picklable object, e.g. dataframes) are stored in cache_dir, keyed by
+    # name and a hash of the contents of inputs, a list of the files and directories the
+    # result depends on, including the code computing it (see digest)
+    # least recently used entries are evicted once the cache holds more than max_bytes
+    path = os.path.join(cache_dir, f"{name}-{digest(inputs, name)}.pickle")
+    try:
+        os.utime(path)
+        return pd.read_pickle(path)
+    except FileNotFoundError:
+        # not cached, or evicted by another action since
+        pass
+
+    result = compute()
+    os.makedirs(cache_dir, exist_ok=True)
+    # each process writes its own temporary file, so that actions computing the same
+    # entry at once do not write over each other
+    tmp = f"{path}.{os.getpid()}.tmp"
+    pd.to_pickle(result, tmp)
+    os.replace(tmp, path)
+    evict(cache_dir, max_bytes)
+    return result
@@ -0,0 +1,130 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc
+
+from functions import eventtable, to_dayoffsets
+from profiling import profiled
+
+
+def cohort_columns(path):
+    # to list the columns of a feather (Arrow IPC) file without reading any data
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def open_cohort(source, columns=None):
+    # to open a reader over an opened feather (Arrow IPC) file
+    # set columns to read only those columns: the projection is pushed down into the
+    # IPC reader, so the other columns are never read or decompressed
+    options = None
+    if columns is not None:
+        schema = pa.ipc.open_file(source).schema
+        missing = [col for col in columns if schema.get_field_index(col) == -1]
+        if missing:
+            raise ValueError(f"feather file has no columns {missing}")
+        options = pa.ipc.IpcReadOptions(
+            included_fields=[schema.get_field_index(col) for col in columns]
+        )
+    return pa.ipc.open_file(source, options=options)
+
+
+def count_batches(path):
+    # to count the record batches in a feather (Arrow IPC) file
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).num_record_batches
+
+
+def since_day(batch, first_day):
+    # to slice a record batch of an event table (see write_event_table) to its rows on or
+    # after first_day: its days are sorted, so the first is found by a binary search of
+    # the memory-mapped day column, which reads only the pages the search touches
+    if first_day is None:
+        return batch
+    index = batch.schema.get_field_index("day")
+    if index == -1:
+        raise ValueError("reading from first_day needs the day column")
+    days = batch.column(index).to_numpy()
+    return batch.slice(np.searchsorted(days, first_day))
+
+
+def read_batch(path, i, columns=None, first_day=None):
+    # to read the i-th record batch of a feather (Arrow IPC) file as a dataframe
+    # set columns to read only those columns, as for open_cohort
+    # set first_day to read only the rows of an event table from that day (see since_day)
+    with pa.memory_map(path) as source:
+        batch = open_cohort(source, columns=columns).get_batch(i)
+        batch = since_day(batch, first_day)
+        return batch.to_pandas(split_blocks=True, date_as_object=False)
+
+
+def iter_cohort(path, columns=None, batch_size=None, first_day=None):
+    # to read a feather (Arrow IPC) file as a series of dataframes, one per record batch,
+    # so that only one batch is converted to pandas at a time
+    # set columns to read only those columns, as for open_cohort
+    # set batch_size to split the file's record batches further, e.g. if it was written
+    # as a single batch; the file is memory-mapped so slicing a batch copies nothing
+    # and, for an uncompressed file (see write_cohort_cache), columns without missing
+    # values are handed to pandas without being copied
+    # set first_day to read only the rows of an event table from that day (see since_day)
+    with pa.memory_map(path) as source:
+        reader = open_cohort(source, columns=columns)
+        for i in range(reader.num_record_batches):
+            batch = since_day(reader.get_batch(i), first_day)
+            step = batch_size or batch.num_rows
+            for offset in range(0, batch.num_rows, max(step, 1)):
+                yield batch.slice(offset, step).to_pandas(
+                    split_blocks=True, date_as_object=False
+                )
+
+
+@profiled()
+def write_event_table(cohort, path, start_date):
+    # to write the sparse long event table (see eventtable) for a cohort feather file,
+    # built one record batch at a time and written as the same number of batches
+    # each batch is sorted by day, so that the events from a day on can be read without
+    # reading the rest (see since_day)
+    columns = [col for col in cohort_columns(cohort) if col.endswith("_date")]
+    writer = None
+    first_row = 0
+    with pa.OSFile(path, "wb") as sink:
+        for df in iter_cohort(cohort, columns=columns):
+            events = eventtable(df, start_date, first_row=first_row)
+            events = events.iloc[np.argsort(events["day"].to_numpy(), kind="stable")]
+            events = pa.RecordBatch.from_pandas(events, preserve_index=False)
+            if writer is None:
+                writer = pa.ipc.new_file(sink, events.schema)
+            writer.write_batch(events)
+            first_row += len(df)
+        if writer is not None:
+            writer.close()
+
+
+@profiled()
+def write_cohort_cache(cohort, path, start_date):
+    # to rewrite a cohort feather file as an uncompressed Arrow IPC file with its dates
+    # held as int16 days since start_date (see to_dayoffsets), written once so that the
+    # analysis actions can memory-map it: actions running together share its pages
+    # through the page cache, and read columns without decompressing or converting them
+    with pa.memory_map(cohort) as source:
+        schema = pa.ipc.open_file(source).schema
+    schema = pa.schema(
+        [
+            (
+                pa.field(field.name, pa.int16())
+                if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type)
+                else field
+            )
+            for field in schema
+        ]
+    )
+
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            for df in iter_cohort(cohort):
+                writer.write_batch(
+                    pa.RecordBatch.from_pandas(
+                        to_dayoffsets(df, start_date),
+                        schema=schema,
+                        preserve_index=False,
+                    )
+                )
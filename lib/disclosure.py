@@ -0,0 +1,94 @@
+import numpy as np
+
+
+def suppress_secondary(values, n, groups=None):
+    # to find the cells to suppress in each column of a 2-D array of counts, so that
+    # suppressed counts cannot be recovered from a column total: counts <= n, and if
+    # those sum to <= n the next smallest counts as well until more than n is suppressed
+    # nothing is suppressed where the counts <= n sum to zero
+    # set groups to an array of stratum codes, one per row, to treat each stratum of
+    # each column separately
+    # every (column, stratum) is handled in a single lexsort on (column, stratum, value)
+    # with the secondary suppressions picked from a cumulative sum of the smallest
+    # remaining counts (ties in row order); returns a boolean array the shape of values
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    nrows, ncols = values.shape
+    if groups is None:
+        groups = np.zeros(nrows, dtype=np.int64)
+    groups = np.asarray(groups, dtype=np.int64)
+    ngroups = groups.max() + 1 if nrows else 0
+
+    # one key per (column, stratum), flattened in column order
+    keys = (np.arange(ncols)[:, None] * ngroups + groups[None, :]).ravel()
+    values = values.T.ravel()
+    small = values <= n
+
+    # primary suppression, only where the small counts sum to non-zero
+    suppressed_count = np.bincount(
+        keys, weights=np.where(small, values, 0), minlength=ncols * ngroups
+    )
+    suppress = small & (suppressed_count[keys] != 0)
+
+    # secondary suppression: walk up each key's remaining counts, smallest first,
+    # suppressing while the total suppressed is still <= n
+    remaining = np.flatnonzero(~small & ~np.isnan(values))
+    remaining = remaining[np.lexsort((values[remaining], keys[remaining]))]
+    remaining_keys = keys[remaining]
+    cumulative = np.cumsum(values[remaining]) - values[remaining]
+    first = np.ones(remaining.size, dtype=bool)
+    first[1:] = remaining_keys[1:] != remaining_keys[:-1]
+    cumulative -= cumulative[np.flatnonzero(first)][np.cumsum(first) - 1]
+    secondary = (suppressed_count[remaining_keys] != 0) & (
+        suppressed_count[remaining_keys] + cumulative <= n
+    )
+    suppress[remaining[secondary]] = True
+
+    return suppress.reshape(ncols, nrows).T
+
+
+def round_to_base(values, base=5):
+    # to round a 2-D array of counts to the nearest multiple of base
+    # halves round to even, as Python's round does
+    return base * np.round(np.asarray(values, dtype=float) / base)
+
+
+def round_midpoint6(values):
+    # to apply midpoint 6 rounding to a 2-D array of counts: counts <= 7 are suppressed
+    # (set to nan) and larger counts become the midpoint of their 6-wide bucket
+    # (7-12 -> 9, 13-18 -> 15, ...)
+    values = np.asarray(values, dtype=float)
+    return np.where(values <= 7, np.nan, np.ceil(values / 6) * 6 - 3)
+
+
+def disclosure_control(df, n=5, rounding="nearest5", secondary=False, by=None):
+    # to redact a table of counts for release in one vectorised pass over its values:
+    # counts <= n are suppressed (set to nan); with secondary = True further counts are
+    # suppressed as in suppress_secondary; the remaining counts are then rounded
+    # set rounding to "nearest5", "midpoint6" or None
+    # set by to a column or list of columns holding strata: these columns are kept
+    # as they are, and secondary suppression is applied within each stratum
+    # returns a redacted copy of df
+    by = [] if by is None else [by] if isinstance(by, str) else list(by)
+    columns = [col for col in df.columns if col not in by]
+    values = df[columns].to_numpy(dtype=float)
+
+    suppress = values <= n
+    if secondary:
+        groups = None
+        if by:
+            groups = df.groupby(by, sort=False, dropna=False).ngroup().to_numpy()
+        suppress |= suppress_secondary(values, n, groups=groups)
+    values[suppress] = np.nan
+
+    if rounding == "nearest5":
+        values = round_to_base(values, 5)
+    elif rounding == "midpoint6":
+        values = round_midpoint6(values)
+    elif rounding is not None:
+        raise ValueError(f"unknown rounding {rounding!r}")
+
+    df = df.copy()
+    df[columns] = values
+    return df
@@ -0,0 +1,287 @@
+import os
+import re
+import runpy
+import sys
+import types
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+
+# approximate share of the registered population in each decade of age, used for the
+# "population_ages" distribution
+POPULATION_AGES = {
+    (0, 10): 0.12,
+    (10, 20): 0.11,
+    (20, 30): 0.13,
+    (30, 40): 0.13,
+    (40, 50): 0.13,
+    (50, 60): 0.13,
+    (60, 70): 0.11,
+    (70, 80): 0.08,
+    (80, 90): 0.05,
+    (90, 105): 0.01,
+}
+
+
+class _Recorder:
+    # stands in for cohortextractor's patients: every call is recorded as
+    # (function name, keyword arguments) rather than run against a database
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            return name, args, kwargs
+
+        return record
+
+
+class _StudyDefinition:
+    def __init__(self, index_date=None, default_expectations=None, **variables):
+        self.index_date = index_date
+        self.default_expectations = default_expectations or {}
+        self.variables = variables
+
+
+def read_study_definition(path="analysis/study_definition.py"):
+    # to read the variables of a study definition, with their return_expectations,
+    # without cohortextractor or a database: the study definition is run against a
+    # stand-in module that records each patients.* call
+    # returns the recorded StudyDefinition, whose variables map each name to
+    # (function name, args, kwargs)
+    stand_in = types.ModuleType("cohortextractor")
+    stand_in.StudyDefinition = _StudyDefinition
+    stand_in.patients = _Recorder()
+    stand_in.Measure = lambda *args, **kwargs: None
+    stand_in.codelist = lambda *args, **kwargs: None
+    stand_in.codelist_from_csv = lambda *args, **kwargs: None
+    stand_in.filter_codes_by_category = lambda *args, **kwargs: None
+
+    saved = {
+        name: sys.modules.pop(name, None) for name in ["cohortextractor", "codelists"]
+    }
+    sys.modules["cohortextractor"] = stand_in
+    sys.path.insert(0, "analysis")
+    try:
+        return runpy.run_path(path)["study"]
+    finally:
+        sys.path.remove("analysis")
+        for name, module in saved.items():
+            sys.modules.pop(name, None)
+            if module is not None:
+                sys.modules[name] = module
+
+
+def _date(value, index_date):
+    if value == "today":
+        return pd.Timestamp.today().normalize()
+    if value == "index_date":
+        return pd.Timestamp(index_date)
+    return pd.Timestamp(value)
+
+
+def _expectations(study, kwargs):
+    expectations = dict(study.default_expectations)
+    expectations.update(kwargs.get("return_expectations") or {})
+    date = dict(study.default_expectations.get("date", {}))
+    date.update((kwargs.get("return_expectations") or {}).get("date", {}))
+    expectations["date"] = date
+    return expectations
+
+
+def _choice(rng, weights, size):
+    # size draws of the indices of weights, in proportion to them
+    # (one comparison pass per weight is faster than searchsorted for the few weights
+    # of a category)
+    cumulative = np.cumsum(weights, dtype=np.float32)
+    draws = rng.random(size, np.float32) * cumulative[-1]
+    choice = np.zeros(size, dtype=np.int8)
+    for threshold in cumulative[:-1]:
+        choice += draws >= threshold
+    return choice
+
+
+def _dates(days, rows, size):
+    # a timestamp[ns] array of size rows, null except at rows, built straight from its
+    # buffers rather than through a datetime64 array with NaT (which arrow would copy)
+    if rows.size == size:
+        values = days * np.int64(86_400_000_000_000)
+        return pa.Array.from_buffers(
+            pa.timestamp("ns"), size, [None, pa.py_buffer(values)]
+        )
+    values = np.zeros(size, dtype=np.int64)
+    values[rows] = days * np.int64(86_400_000_000_000)
+    valid = np.zeros(size, dtype=bool)
+    valid[rows] = True
+    validity = pa.py_buffer(np.packbits(valid, bitorder="little"))
+    return pa.Array.from_buffers(
+        pa.timestamp("ns"), size, [validity, pa.py_buffer(values)], size - rows.size
+    )
+
+
+def dummy_batch(study, size, rng, start=0):
+    # to generate size rows of a dummy cohort for a study definition (see
+    # read_study_definition) as an arrow record batch, honouring each variable's
+    # return_expectations: date ranges, incidence (with "rate": "universal" meaning every
+    # patient), category ratios and int distributions
+    # dates chained with on_or_after="{previous} + {n} days" fall at least n days after
+    # the previous date, and are missing wherever it is; their incidence is kept as
+    # close to the expected (marginal) incidence as the chaining allows
+    # start numbers the rows, so that chunks of one cohort have distinct patient_ids
+    columns = {"patient_id": pa.array(np.arange(start, start + size, dtype=np.int64))}
+    # (rows, whole days since 1970-01-01) of the date variables generated so far
+    dates = {}
+
+    for name, (function, args, kwargs) in study.variables.items():
+        if name == "population":
+            continue
+        expectations = _expectations(study, kwargs)
+        if expectations.get("rate") == "universal":
+            incidence = 1.0
+        else:
+            incidence = expectations.get("incidence", 1.0)
+        returning = kwargs.get("returning", "binary_flag")
+
+        if "category" in expectations:
+            ratios = expectations["category"]["ratios"]
+            labels = list(ratios)
+            choice = pa.array(_choice(rng, [ratios[label] for label in labels], size))
+            if all(label.isdigit() for label in labels):
+                columns[name] = pa.array([int(label) for label in labels]).take(choice)
+            else:
+                columns[name] = pa.array(labels).take(choice)
+
+        elif "int" in expectations:
+            spec = expectations["int"]
+            if spec.get("distribution") == "population_ages":
+                bands = list(POPULATION_AGES)
+                band = _choice(rng, list(POPULATION_AGES.values()), size)
+                lower = np.array([low for low, _ in bands])[band]
+                upper = np.array([high for _, high in bands])[band]
+                values = lower + (
+                    rng.random(size, np.float32) * (upper - lower)
+                ).astype(np.int64)
+            else:
+                values = np.round(
+                    rng.normal(spec.get("mean", 0), spec.get("stddev", 1), size=size)
+                ).astype(np.int64)
+            columns[name] = pa.array(values)
+
+        elif returning in ("date", "date_of_death") or "date_format" in kwargs:
+            epoch = pd.Timestamp("1970-01-01")
+            earliest = _date(expectations["date"]["earliest"], study.index_date)
+            latest = _date(expectations["date"]["latest"], study.index_date)
+            earliest = (earliest - epoch).days
+            latest = (latest - epoch).days
+
+            # one uniform draw per candidate row decides both whether it has a date
+            # (u < p) and, rescaled to u / p, where the date falls; chained dates are
+            # only drawn for the rows with a previous date
+            chained = re.fullmatch(
+                r"(\w+) \+ (\d+) days", str(kwargs.get("on_or_after"))
+            )
+            if chained and chained.group(1) in dates:
+                rows, previous_days = dates[chained.group(1)]
+                lower = previous_days + np.int32(chained.group(2))
+                incidence = incidence * size / max(rows.size, 1)
+            else:
+                rows = np.arange(size, dtype=np.int32)
+                lower = np.int32(earliest)
+            u = rng.random(rows.size, np.float32)
+            if incidence < 1:
+                keep = np.flatnonzero(u < incidence)
+                rows = rows[keep]
+                u = u[keep] / np.float32(incidence)
+                if lower.ndim:
+                    lower = lower[keep]
+            if lower.ndim:
+                lower = np.maximum(lower, earliest)
+                keep = np.flatnonzero(lower <= latest)
+                rows = rows[keep]
+                lower = lower[keep]
+                u = u[keep]
+            # float32 rounding can land u * span on span itself
+            days = np.minimum(
+                lower + (u * (latest - lower + 1)).astype(np.int32), np.int32(latest)
+            )
+
+            dates[name] = (rows, days)
+            columns[name] = _dates(days, rows, size)
+
+        else:
+            flags = (rng.random(size, np.float32) < incidence).astype(np.int64)
+            columns[name] = pa.array(flags)
+
+    return pa.RecordBatch.from_arrays(list(columns.values()), names=list(columns))
+
+
+def dummy_cohort(study, size, rng, start=0):
+    # to generate size rows of a dummy cohort as a dataframe (see dummy_batch)
+    return dummy_batch(study, size, rng, start=start).to_pandas()
+
+
+def _dummy_chunk(study, size, seed, start, path=None):
+    # a chunk of a dummy cohort drawn from its own random stream; with path, the chunk
+    # is written there as a feather (Arrow IPC) file rather than returned, so that it
+    # reaches the writing process through the page cache rather than being pickled
+    batch = dummy_batch(study, size, np.random.default_rng(seed), start=start)
+    if path is None:
+        return batch
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+    return path
+
+
+def _dummy_chunks(tasks, jobs, path):
+    # the chunks for tasks, in order, generated across jobs processes; no more than
+    # 2 * jobs are held at once (as temporary files next to path), waiting to be written
+    if jobs == 1:
+        for task in tasks:
+            yield _dummy_chunk(*task)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        try:
+            for i, task in enumerate(tasks):
+                pending.append(pool.submit(_dummy_chunk, *task, f"{path}.{i}.tmp"))
+                if len(pending) >= 2 * jobs:
+                    yield from _read_chunk(pending.popleft().result())
+            while pending:
+                yield from _read_chunk(pending.popleft().result())
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown()
+            for i in range(len(tasks)):
+                if os.path.exists(f"{path}.{i}.tmp"):
+                    os.remove(f"{path}.{i}.tmp")
+
+
+def _read_chunk(path):
+    with pa.memory_map(path) as source:
+        yield pa.ipc.open_file(source).get_batch(0)
+    os.remove(path)
+
+
+def write_dummy_cohort(study, path, size, chunk_size=250_000, seed=0, jobs=1):
+    # to write a dummy cohort of size rows to a feather (Arrow IPC) file, generated and
+    # written chunk_size rows at a time so that memory does not grow with size
+    # each chunk is drawn from its own random stream spawned from seed, so that chunks
+    # can be generated across jobs processes and the file is the same for any jobs
+    starts = range(0, size, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    tasks = [
+        (study, min(chunk_size, size - start), chunk_seed, start)
+        for start, chunk_seed in zip(starts, seeds)
+    ]
+    writer = None
+    with pa.OSFile(path, "wb") as sink:
+        for batch in _dummy_chunks(tasks, jobs, path):
+            if writer is None:
+                writer = pa.ipc.new_file(sink, batch.schema)
+            writer.write_batch(batch)
+        if writer is not None:
+            writer.close()
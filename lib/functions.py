@@ -1,15 +1,64 @@
+import re
+from statistics import NormalDist
+
 import numpy as np
 import pandas as pd
 
+from disclosure import suppress_secondary
+
 
-def eventcountseries(event_dates, date_range, rule="D", popadjust=False):
+def eventcountseries(
+    event_dates, date_range, rule="D", popadjust=False, start_date=None
+):
     # to calculate the daily count for events recorded in a series
     # where event_dates is a series
     # set popadjust = 1000, say, to report counts per 1000 population
+    # event_dates can also hold int16 day offsets (see dayoffsets) from start_date, by
+    # default the first day of date_range
+    # for fixed periods (see periodbins), e.g. rule = "W", days are binned straight into
+    # periods by their day number rather than reindexed daily and resampled
     pop = event_dates.size
-    counts = event_dates.value_counts().reindex(date_range.index, fill_value=0)
-    if rule != "D":
-        counts = counts.resample(rule).sum()
+    bins, labels = periodbins(date_range.index, rule)
+    if bins is not None:
+        first = date_range.index[0]
+        if pd.api.types.is_integer_dtype(event_dates):
+            # the days of date_range are counted straight from the offsets; as unsigned,
+            # days before it (and MISSING_DAY) are beyond it
+            days = event_dates.to_numpy().astype(np.int32)
+            if start_date is not None:
+                days += (pd.Timestamp(start_date) - first).days
+            days = days[days.view(np.uint32) < len(bins)]
+            daily = np.bincount(days, minlength=len(bins))
+        else:
+            # hashing dates (value_counts) is faster than dividing them into day numbers,
+            # so only the distinct dates are turned into days
+            counts = event_dates.value_counts(sort=False)
+            days = (counts.index - first).days.to_numpy()
+            inrange = (days >= 0) & (days < len(bins))
+            daily = np.bincount(
+                days[inrange], counts.to_numpy()[inrange], minlength=len(bins)
+            )
+        counts = np.bincount(bins, daily, minlength=len(labels)).astype(np.int64)
+        counts = pd.Series(counts, index=labels, name=event_dates.name)
+    else:
+        if pd.api.types.is_integer_dtype(event_dates):
+            # offsets are turned back into dates to be matched against date_range
+            start = pd.Timestamp(
+                date_range.index[0] if start_date is None else start_date
+            )
+            days = event_dates.to_numpy()
+            event_dates = pd.Series(
+                np.where(
+                    days == MISSING_DAY,
+                    np.datetime64("NaT"),
+                    np.datetime64(start.date(), "D") + days.astype("timedelta64[D]"),
+                ).astype("datetime64[ns]"),
+                index=event_dates.index,
+                name=event_dates.name,
+            )
+        counts = event_dates.value_counts().reindex(date_range.index, fill_value=0)
+        if rule != "D":
+            counts = counts.resample(rule).sum()
     if popadjust is not False:
         pop = event_dates.size
         poppern = pop / popadjust
@@ -17,78 +66,553 @@ def eventcountseries(event_dates, date_range, rule="D", popadjust=False):
     return counts
 
 
-def KMestimate(times, indicators):
+def periodbins(dates, rule):
+    # to bin consecutive days (a daily DatetimeIndex) into the periods of a pandas
+    # rule as resample(rule) would, arithmetically from their day numbers
+    # returns (bins, labels): the period of each day, numbered from 0, and the label of
+    # each period; or (None, None) where the rule is not a fixed period ("W", "W-MON",
+    # "7D" and "D" are; "M" and "2W" are not) or dates are not consecutive days
+    offset = pd.tseries.frequencies.to_offset(rule)
+    days = dates.to_numpy().astype("datetime64[D]").astype(np.int64)
+    if len(days) == 0 or not (np.diff(days) == 1).all():
+        return None, None
+    if (
+        isinstance(offset, pd.offsets.Week)
+        and offset.n == 1
+        and offset.weekday is not None
+    ):
+        # periods end on the weekday (Monday = 0) and are labelled with that day; day 0,
+        # 1970-01-01, was a Thursday
+        ends = days + (offset.weekday - (days + 3)) % 7
+        bins = (ends - ends[0]) // 7
+        first = ends[0]
+        step = 7
+    elif isinstance(offset, pd.offsets.Tick) and offset.nanos % 86_400_000_000_000 == 0:
+        # periods start from the first day and are labelled with their first day
+        step = offset.nanos // 86_400_000_000_000
+        bins = (days - days[0]) // step
+        first = days[0]
+    else:
+        return None, None
+    labels = pd.DatetimeIndex(
+        (first + step * np.arange(bins[-1] + 1)).astype("datetime64[D]"),
+        freq=offset,
+        name=dates.name,
+    )
+    return bins, labels
+
+
+def sumperiods(df, rule):
+    # to sum a frame of daily values (indexed by consecutive days) over the periods of
+    # a pandas rule, as df.resample(rule).sum() would (see periodbins)
+    bins, labels = periodbins(df.index, rule)
+    if bins is None:
+        return df.resample(rule).sum()
+    values = df.to_numpy()
+    sums = np.zeros((len(labels), values.shape[1]), dtype=values.dtype)
+    np.add.at(sums, bins, values)
+    return pd.DataFrame(sums, index=labels, columns=df.columns)
+
+
+def ageband(age, bands):
+    # to band ages, where bands is a list of lower bounds in years, e.g. [0, 18, 40]
+    # gives a categorical series of "0-17", "18-39" and "40+"
+    labels = [f"{lower}-{upper - 1}" for lower, upper in zip(bands[:-1], bands[1:])]
+    labels.append(f"{bands[-1]}+")
+    return pd.cut(age, bins=list(bands) + [np.inf], right=False, labels=labels)
+
+
+def imdband(imd, bands):
+    # to band IMD ranks, where bands is a list of lower bounds of rank, e.g. quintiles,
+    # gives a categorical series of "1" (most deprived) to len(bands); ranks below
+    # bands[0] (0 for an unknown address) are missing
+    labels = [str(i) for i in range(1, len(bands) + 1)]
+    return pd.cut(imd, bins=list(bands) + [np.inf], right=False, labels=labels)
+
+
+# dates are held compactly as int16 days since a start date; this marks a missing date
+MISSING_DAY = np.iinfo(np.int16).min
+
+
+def dayoffsets(dates, start_date):
+    # to convert dates (a series or array of dates) into int16 whole days since start_date
+    # missing dates become MISSING_DAY, which falls outside any range of days counted
+    # dates already held as integer day offsets are returned unchanged
+    dates = np.asarray(dates)
+    if np.issubdtype(dates.dtype, np.integer):
+        return dates
+    dates = dates.astype("datetime64[D]")
+    start = np.datetime64(pd.Timestamp(start_date).date(), "D")
+
+    missing = np.isnat(dates)
+    days = (dates - start).astype(np.int64)
+    days[missing] = MISSING_DAY
+    if (
+        (days[~missing] <= MISSING_DAY) | (days[~missing] > np.iinfo(np.int16).max)
+    ).any():
+        raise ValueError(
+            f"dates more than 89 years from {start} cannot be held as int16"
+        )
+    return days.astype(np.int16)
+
+
+def to_dayoffsets(df, start_date):
+    # to convert every datetime column of a dataframe into int16 days since start_date
+    # (see dayoffsets), a quarter of the memory of datetime64 columns
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = dayoffsets(df[col], start_date)
+    return df
+
+
+def eventcolumn(col):
+    # to split a {codelist}_X{i}_date column name into (codelist, i)
+    # returns None for any other column
+    match = re.fullmatch(r"(.+)_X(\d+)_date", col)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def eventtable(df, start_date, first_row=0):
+    # to turn the wide {codelist}_X{i}_date columns of a cohort into a sparse long table
+    # with one row per recorded event: patient_row (position of the patient in the cohort,
+    # counting from first_row), codelist (categorical), occurrence (i) and day (int16 days
+    # since start_date, see dayoffsets); missing dates take no rows
+    columns = {col: eventcolumn(col) for col in df.columns if eventcolumn(col)}
+    categories = pd.unique(
+        pd.Series([event[0] for event in columns.values()], dtype=object)
+    )
+    position = {codelist: i for i, codelist in enumerate(categories)}
+
+    events = []
+    for col, (codelist, occurrence) in columns.items():
+        days = dayoffsets(df[col], start_date)
+        rows = np.flatnonzero(days != MISSING_DAY)
+        events.append(
+            pd.DataFrame(
+                {
+                    "patient_row": (rows + first_row).astype(np.int32),
+                    "codelist": pd.Categorical.from_codes(
+                        np.full(rows.size, position[codelist]),
+                        categories=categories,
+                    ),
+                    "occurrence": np.full(rows.size, occurrence, dtype=np.int8),
+                    "day": days[rows],
+                }
+            )
+        )
+
+    if not events:
+        return pd.DataFrame(
+            {
+                "patient_row": np.array([], dtype=np.int32),
+                "codelist": pd.Categorical([]),
+                "occurrence": np.array([], dtype=np.int8),
+                "day": np.array([], dtype=np.int16),
+            }
+        )
+    return pd.concat(events, ignore_index=True)
+
+
+def episodes(events, min_days):
+    # to apply the min_days rule to a long event table (patient_row, codelist and day, as
+    # from eventtable or from one extraction of every event): for each patient and
+    # codelist the first event is kept, then each first event at least min_days after the
+    # last one kept, as the chained {codelist}_X{i}_date variables of the study
+    # definition are extracted, but with no limit on the number of events kept
+    # returns the kept events sorted by patient_row, codelist and day, with occurrence
+    # numbering them from 1 (as int16, as there can be more than the int8 occurrence of
+    # eventtable holds)
+    # the event table written by write_event_table is not passed through this: its dates
+    # are extracted following the rule already, so this is for an extraction of every
+    # event, which the study definition does not yet make
+    if min_days < 1:
+        raise ValueError(f"min_days must be at least 1, not {min_days}")
+    events = events[events["day"].to_numpy() != MISSING_DAY]
+    patient = events["patient_row"].to_numpy().astype(np.int64)
+    codelist = events["codelist"].cat.codes.to_numpy().astype(np.int64)
+    day = events["day"].to_numpy().astype(np.int64)
+    ncodelists = len(events["codelist"].cat.categories)
+    n = day.size
+
+    # each segment is one patient's events from one codelist; events are sorted by a
+    # single key of segment and day, with segments spaced so that day + min_days stays
+    # in its segment, which sorts far faster than a lexsort and is decoded afterwards
+    first_patient = patient.min() if n else 0
+    first_day = day.min() if n else 0
+    span = (day.max() - first_day if n else 0) + min_days + 1
+    segment = (patient - first_patient) * ncodelists + codelist
+    key = np.sort(segment * span + (day - first_day))
+    segment = key // span
+    newsegment = np.ones(n, dtype=bool)
+    newsegment[1:] = segment[1:] != segment[:-1]
+
+    # the event that would be kept next after each event, if it were kept (n if none)
+    following = np.searchsorted(key, key + min_days, side="left")
+    inside = following < n
+    inside[inside] = segment[following[inside]] == segment[inside]
+    following[~inside] = n
+
+    # kept events are followed from the first of every segment, all segments at once,
+    # so the number of steps is the most events kept in any one segment
+    occurrence = np.zeros(n, dtype=np.int16)
+    kept = np.flatnonzero(newsegment)
+    i = 1
+    while kept.size:
+        occurrence[kept] = i
+        kept = following[kept]
+        kept = kept[kept < n]
+        i += 1
+
+    kept = np.flatnonzero(occurrence)
+    segment = segment[kept]
+    return pd.DataFrame(
+        {
+            "patient_row": (segment // ncodelists + first_patient).astype(np.int32),
+            "codelist": pd.Categorical.from_codes(
+                segment % ncodelists, categories=events["codelist"].cat.categories
+            ),
+            "occurrence": occurrence[kept],
+            "day": (key[kept] % span + first_day).astype(np.int16),
+        }
+    )
+
+
+def eventtablecounts(events, date_range, start_date=None, groups=None):
+    # to calculate the daily count for each codelist from an event table (see eventtable)
+    # where the table's days are offsets from the start of date_range
+    # counted with a single bincount over a flattened (group, day, codelist) index
+    # set start_date if the table's days are offsets from an earlier date, e.g. to count
+    # only the most recent part of the table's date range
+    # set groups to a categorical series with one stratum per cohort row (indexed by the
+    # table's patient_row) to count every stratum at once; the result is then indexed by
+    # (stratum, "date"), and events of patients with a missing stratum are not counted
+    ndays = len(date_range.index)
+    codelists = events["codelist"].cat.categories
+    codes = events["codelist"].cat.codes.to_numpy().astype(np.int64)
+    days = events["day"].to_numpy().astype(np.int64)
+    if start_date is not None:
+        days -= (date_range.index[0] - pd.Timestamp(start_date)).days
+
+    if groups is None:
+        strata = np.zeros(days.size, dtype=np.int64)
+        nstrata = 1
+    else:
+        rows = events["patient_row"].to_numpy()
+        strata = groups.cat.codes.to_numpy()[rows].astype(np.int64)
+        nstrata = groups.cat.categories.size
+
+    keep = (days >= 0) & (days < ndays) & (strata >= 0)
+    flat = (strata[keep] * ndays + days[keep]) * codelists.size + codes[keep]
+    counts = np.bincount(flat, minlength=nstrata * ndays * codelists.size).reshape(
+        nstrata * ndays, codelists.size
+    )
+
+    if groups is None:
+        return pd.DataFrame(counts, index=date_range.index, columns=codelists.tolist())
+    index = pd.MultiIndex.from_product(
+        [groups.cat.categories, date_range.index], names=[groups.name, "date"]
+    )
+    return pd.DataFrame(counts, index=index, columns=codelists.tolist())
+
+
+def KMestimate(times, indicators, horizon=None, ci=None):
 
     ## function that takes event times (=times, a series) and a censor indicator (=indicators, a series taking values 1=event, 0=censor)
     ## and produces a kaplan meier estimates in a dataframe
+    ## set horizon to estimate whole-day times only up to that day (see KMestimate_multi)
+    ## set ci (e.g. 0.95) to add the "lower" and "upper" limits of a confidence interval
+
+    kmdata = KMestimate_multi(
+        times, {"event": np.asarray(indicators)}, horizon=horizon, ci=ci
+    )
+    return kmdata.drop(columns="outcome")
 
-    times = np.array(times)
-    indicators = np.array(indicators)
-    sortinds = times.argsort()
-    times = times[sortinds]
-    indicators = indicators[sortinds]
-
-    min_time = 0
-    max_time = times.max()
-    atrisk0 = len(times)
-
-    unq_times, counts = np.unique(times, return_counts=True)
-    event_times, event_counts = np.unique(times[indicators == 1], return_counts=True)
-    censor_times, censor_counts = np.unique(times[indicators == 0], return_counts=True)
-
-    cml_counts = counts.cumsum()
-    atrisk = (atrisk0 - cml_counts) + counts
-
-    kmdata = (
-        pd.DataFrame({"times": unq_times, "atrisk": atrisk})
-        .merge(
-            pd.DataFrame({"times": event_times, "died": event_counts}),
-            on="times",
-            how="left",
+
+def KMestimate_multi(times, indicators, outcomes=None, horizon=None, ci=None):
+
+    ## as KMestimate, but for several outcomes that share the same event times
+    ## (=indicators, a dataframe or dict with one 1=event, 0=censor column per outcome)
+    ## times are sorted once and every outcome's curve is returned in one long
+    ## dataframe, labelled by an "outcome" column holding the indicator column name
+    ## set outcomes to name the columns if indicators is a 2-D array
+    ## set horizon (a day) for times in whole days: they are counted into one array per
+    ## day rather than sorted, and only times up to horizon are returned, so the cost
+    ## depends on the horizon rather than the number of distinct times
+    ## set ci (e.g. 0.95) to add the "lower" and "upper" limits of a log-log confidence
+    ## interval from Greenwood's variance
+
+    times = np.asarray(times)
+    indicators = pd.DataFrame(indicators, columns=outcomes)
+    if horizon is not None:
+        return _KMestimate_days(times, indicators, horizon, ci)
+
+    # a single sort: inverse maps every observation onto its unique time
+    unq_times, inverse, counts = np.unique(
+        times, return_inverse=True, return_counts=True
+    )
+    inverse = inverse.ravel()
+    ntimes = unq_times.size
+
+    # number still at risk just before each time, shared by every outcome
+    atrisk = times.size - counts.cumsum() + counts
+
+    kmdata = []
+    for outcome in indicators.columns:
+        status = indicators[outcome].to_numpy()
+        died = np.bincount(inverse, weights=status == 1, minlength=ntimes)
+        censored = np.bincount(inverse, weights=status == 0, minlength=ntimes)
+        kmdata.append(_KMframe(outcome, unq_times, atrisk, died, censored, ci))
+
+    return pd.concat(kmdata, ignore_index=True)
+
+
+def _KMframe(outcome, times, atrisk, died, censored, ci):
+    kmdata = pd.DataFrame(
+        {
+            "outcome": outcome,
+            "times": times,
+            "atrisk": atrisk,
+            "died": died,
+            "censored": censored,
+            "kmestimate": np.cumprod((atrisk - died) / atrisk),
+        }
+    )
+    if ci is not None:
+        kmdata["lower"], kmdata["upper"] = _KMconfidence(
+            atrisk, died, kmdata["kmestimate"].to_numpy(), ci
         )
-        .merge(
-            pd.DataFrame({"times": censor_times, "censored": censor_counts}),
-            on="times",
-            how="left",
+    return kmdata
+
+
+def _KMconfidence(atrisk, died, kmestimate, ci):
+
+    ## log-log confidence limits: Greenwood's variance of log(-log S) is
+    ## sum(d / (n (n - d))) / log(S)^2, and the limits are S^exp(+-z se)
+    ## where no-one has died yet (S = 1) or everyone has (S = 0) the limits are S
+
+    z = NormalDist().inv_cdf(0.5 + ci / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        greenwood = np.cumsum(died / (atrisk * (atrisk - died)))
+        se = np.sqrt(greenwood) / np.abs(np.log(kmestimate))
+        lower = kmestimate ** np.exp(z * se)
+        upper = kmestimate ** np.exp(-z * se)
+    certain = (kmestimate == 1) | (kmestimate == 0)
+    return np.where(certain, kmestimate, lower), np.where(certain, kmestimate, upper)
+
+
+def _KMestimate_days(times, indicators, horizon, ci=None):
+
+    ## KMestimate_multi for whole-day times up to horizon: days from the earliest time
+    ## (or day 0) to horizon are counted with bincount, with one more slot for every
+    ## time after horizon, which counts towards those at risk but is not returned
+
+    times = times.astype(np.int64)
+    first = min(times.min(), 0) if times.size else 0
+    days = np.minimum(times - first, horizon - first + 1)
+    ndays = horizon - first + 2
+
+    counts = np.bincount(days, minlength=ndays)
+    atrisk = times.size - counts.cumsum() + counts
+    # only the days with any times are returned, as by KMestimate_multi
+    observed = np.flatnonzero(counts[:-1])
+    atrisk = atrisk[observed]
+
+    kmdata = []
+    for outcome in indicators.columns:
+        died = np.bincount(
+            days, weights=indicators[outcome].to_numpy() == 1, minlength=ndays
+        )
+        died = died[observed]
+        censored = counts[observed] - died
+        kmdata.append(_KMframe(outcome, observed + first, atrisk, died, censored, ci))
+
+    return pd.concat(kmdata, ignore_index=True)
+
+
+def CIFestimate(times, causes, horizon=None, categories=None):
+
+    ## Aalen-Johansen cumulative incidence of competing causes (=causes, a series of
+    ## the cause of each event, e.g. death_category, missing where the time is censored)
+    ## the incidence of cause k at t is the sum over times up to t of S(before) d_k / n,
+    ## where S is the KM survival from all causes, so no cause is treated as censoring
+    ## another; every cause is counted in the same single pass over the sorted times
+    ## returns a long dataframe labelled by an "outcome" column holding the cause, with
+    ## the columns of KMestimate_multi, where "died" counts deaths from that cause and
+    ## "kmestimate" is 1 - cumulative incidence, so that it plots like a KM curve
+    ## set horizon for whole-day times as in KMestimate_multi
+    ## causes can be a categorical, to return a curve for each of its categories, with
+    ## no incidence for any cause with no deaths; otherwise causes are those observed
+    ## set categories to give causes as the integer codes of those categories (-1 where
+    ## censored), e.g. to pass them through parallel.map_shared
+
+    times = np.asarray(times)
+    codes, labels = _causecodes(causes, categories)
+    ncauses = len(labels)
+
+    if horizon is None:
+        unq_times, inverse, counts = np.unique(
+            times, return_inverse=True, return_counts=True
         )
+        slots = inverse.ravel()
+        nslots = unq_times.size
+    else:
+        times = times.astype(np.int64)
+        first = min(times.min(), 0) if times.size else 0
+        slots = np.minimum(times - first, horizon - first + 1)
+        nslots = horizon - first + 2
+
+    # one count per (time, cause) with censored times as cause 0
+    cells = np.bincount(
+        slots * (ncauses + 1) + codes + 1, minlength=nslots * (ncauses + 1)
     )
+    cells = cells.reshape(nslots, ncauses + 1)
+    counts = cells.sum(axis=1)
+    atrisk = times.size - counts.cumsum() + counts
+    if horizon is not None:
+        observed = np.flatnonzero(counts[:-1])
+        unq_times = observed + first
+        cells = cells[observed]
+        atrisk = atrisk[observed]
 
-    kmdata[["died", "censored"]] = kmdata[["died", "censored"]].fillna(0)
+    died = cells[:, 1:]
+    survival = np.cumprod((atrisk - died.sum(axis=1)) / atrisk)
+    before = np.concatenate([[1.0], survival[:-1]])
+    incidence = np.cumsum(before[:, None] * died / atrisk[:, None], axis=0)
 
-    kmdata["kmestimate"] = 1
-    for i in kmdata.index:
-        if i == 0:
-            kmdata.loc[i, "kmestimate"] = (
-                1
-                * (kmdata.loc[i, "atrisk"] - kmdata.loc[i, "died"])
-                / kmdata.loc[i, "atrisk"]
-            )
-        else:
-            kmdata.loc[i, "kmestimate"] = (
-                kmdata.loc[i - 1, "kmestimate"]
-                * (kmdata.loc[i, "atrisk"] - kmdata.loc[i, "died"])
-                / kmdata.loc[i, "atrisk"]
+    kmdata = [
+        pd.DataFrame(
+            {
+                "outcome": cause,
+                "times": unq_times,
+                "atrisk": atrisk,
+                "died": died[:, k].astype(float),
+                "censored": cells[:, 0].astype(float),
+                "kmestimate": 1 - incidence[:, k],
+            }
+        )
+        for k, cause in enumerate(labels)
+    ]
+    if not kmdata:
+        # no causes at all: every time censored, and causes not categorical
+        columns = ["outcome", "times", "atrisk", "died", "censored", "kmestimate"]
+        return pd.DataFrame(columns=columns)
+    return pd.concat(kmdata, ignore_index=True)
+
+
+def _causecodes(causes, categories=None):
+
+    ## the code of each cause (-1 where missing) and the causes they code: the
+    ## categories of a categorical, or else the causes observed, sorted
+    ## set categories if causes are already codes of those categories
+
+    if categories is not None:
+        return np.asarray(causes).astype(np.int64), pd.Index(categories)
+    causes = pd.Series(causes)
+    if isinstance(causes.dtype, pd.CategoricalDtype):
+        return causes.cat.codes.to_numpy(), causes.cat.categories
+    return pd.factorize(causes, sort=True)
+
+
+def KMestimate_stratified(times, indicators, groups):
+
+    ## as KMestimate, but with a separate curve for every stratum of groups
+    ## (=groups, a series or dataframe of stratifying variables, e.g. region and sex)
+    ## observations are lexsorted once on (stratum, time) and each stratum's curve is
+    ## built with a segmented cumulative product, rather than slicing per stratum
+    ## returns a long dataframe with the stratifying variables followed by the KMestimate columns
+
+    times = np.asarray(times)
+    status = np.asarray(indicators)
+    groups = pd.DataFrame(groups)
+
+    # strata are numbered from the code of each variable (missing values last, as their
+    # own stratum), so only the strata that occur are numbered, in sorted order
+    keys = []
+    uniques = []
+    for col in groups.columns:
+        key, unique = pd.factorize(groups[col], sort=True)
+        keys.append(np.where(key == -1, len(unique), key))
+        uniques.append(unique)
+    stratum_keys, codes = np.unique(np.column_stack(keys), axis=0, return_inverse=True)
+    codes = codes.ravel()
+    labels = pd.DataFrame(
+        {
+            col: unique.array.take(
+                np.where(stratum_keys[:, j] == len(unique), -1, stratum_keys[:, j]),
+                allow_fill=True,
             )
+            for j, (col, unique) in enumerate(zip(groups.columns, uniques))
+        }
+    )
 
-    return kmdata
+    order = np.lexsort((times, codes))
+    codes = codes[order]
+    times = times[order]
+    status = status[order]
 
+    # each block is one distinct time within one stratum
+    newblock = np.ones(times.size, dtype=bool)
+    newblock[1:] = (codes[1:] != codes[:-1]) | (times[1:] != times[:-1])
+    starts = np.flatnonzero(newblock)
+    block = np.cumsum(newblock) - 1
+    block_codes = codes[starts]
 
-def redact_small_numbers(df, n, colname):
-    def suppress_column(column):
-        suppressed_count = column[column <= n].sum()
-        if suppressed_count == 0:
-            pass
+    # at risk = rows from this block to the end of its stratum
+    atrisk = np.searchsorted(codes, block_codes, side="right") - starts
+    died = np.bincount(block, weights=status == 1, minlength=starts.size)
+    censored = np.bincount(block, weights=status == 0, minlength=starts.size)
+
+    # segmented cumulative product: cumulative sum of logs restarted at the first
+    # block of every stratum, with any zero factor zeroing the rest of its stratum
+    newgroup = np.ones(starts.size, dtype=bool)
+    newgroup[1:] = block_codes[1:] != block_codes[:-1]
+    segment = np.cumsum(newgroup) - 1
+    first = np.flatnonzero(newgroup)
+
+    factor = (atrisk - died) / atrisk
+    zeros = factor == 0
+    logs = np.log(np.where(zeros, 1.0, factor))
+    cumlogs = np.cumsum(logs)
+    cumlogs -= (cumlogs - logs)[first][segment]
+    cumzeros = np.cumsum(zeros)
+    cumzeros -= (cumzeros - zeros)[first][segment]
+
+    kmdata = labels.iloc[block_codes].reset_index(drop=True)
+    kmdata["times"] = times[starts]
+    kmdata["atrisk"] = atrisk
+    kmdata["died"] = died
+    kmdata["censored"] = censored
+    kmdata["kmestimate"] = np.where(cumzeros > 0, 0.0, np.exp(cumlogs))
+
+    return kmdata
 
-        else:
-            column[column <= n] = np.nan
 
-            while suppressed_count <= n:
-                suppressed_count += column.min()
-                column[column.idxmin()] = np.nan
+def redact_small_numbers(df, n, colname, by=None, copy=True):
+    # to suppress counts <= n in colname; if the suppressed counts total <= n, the next
+    # smallest counts are suppressed as well until more than n has been suppressed
+    # colname can be a list of columns, each suppressed separately
+    # set by to a column or list of columns to suppress within each stratum separately
+    # set copy = False to redact df in place rather than a copy of it
+    # see disclosure.suppress_secondary
+    if copy:
+        df = df.copy()
+    columns = [colname] if isinstance(colname, str) else list(colname)
+    groups = None
+    if by is not None:
+        groups = df.groupby(by, sort=False, dropna=False).ngroup().to_numpy()
 
-        return column
+    values = df[columns].to_numpy(dtype=float)
+    suppress = suppress_secondary(values, n, groups=groups)
+    # columns with nothing suppressed are left as they are (e.g. as int)
+    for j, col in enumerate(columns):
+        if suppress[:, j].any():
+            column = values[:, j]
+            column[suppress[:, j]] = np.nan
+            df[col] = column
 
-    df[colname] = suppress_column(df[colname])
     return df
 
 
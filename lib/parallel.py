@@ -0,0 +1,85 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from cohort import count_batches, iter_cohort, read_batch
+
+
+def share(array):
+    # to copy an array into a shared memory segment
+    # returns the segment, which the caller must close and unlink, and a picklable
+    # (name, shape, dtype) descriptor that attach turns back into the array
+    array = np.ascontiguousarray(array)
+    segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+    return segment, (segment.name, array.shape, array.dtype.str)
+
+
+def attach(descriptor):
+    # to view an array shared by share without copying it
+    # returns the segment, which the caller must close once the array is released
+    name, shape, dtype = descriptor
+    segment = shared_memory.SharedMemory(name=name)
+    return segment, np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+
+
+def _shared_task(func, descriptors, kwargs):
+    segments, arrays = zip(*[attach(descriptor) for descriptor in descriptors])
+    try:
+        return func(*arrays, **kwargs)
+    finally:
+        del arrays
+        for segment in segments:
+            segment.close()
+
+
+def map_shared(func, tasks, jobs=1, **kwargs):
+    # to run func(*arrays, **kwargs) for each tuple of arrays in tasks, across jobs
+    # processes; the arrays are passed to the workers through shared memory rather than
+    # pickled, and the results are returned in task order, so are the same as a serial run
+    # func must not return views of its arrays
+    if jobs == 1:
+        return [func(*arrays, **kwargs) for arrays in tasks]
+
+    segments = []
+    descriptors = []
+    try:
+        for arrays in tasks:
+            shared = [share(array) for array in arrays]
+            segments.extend(segment for segment, _ in shared)
+            descriptors.append([descriptor for _, descriptor in shared])
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                pool.submit(_shared_task, func, task, kwargs) for task in descriptors
+            ]
+            return [future.result() for future in futures]
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+
+def _batch_task(func, path, i, columns, first_day, kwargs):
+    return func(read_batch(path, i, columns=columns, first_day=first_day), **kwargs)
+
+
+def map_batches(func, path, columns=None, jobs=1, first_day=None, **kwargs):
+    # to run func(batch, **kwargs) for each record batch of a feather (Arrow IPC) file,
+    # across jobs processes; each worker memory-maps the file and reads its own batch,
+    # so the batches are shared through the page cache rather than pickled
+    # set first_day to read only the rows of an event table from that day (see
+    # cohort.since_day)
+    # results are yielded in batch order, so are the same as a serial run
+    if jobs == 1:
+        for batch in iter_cohort(path, columns=columns, first_day=first_day):
+            yield func(batch, **kwargs)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(_batch_task, func, path, i, columns, first_day, kwargs)
+            for i in range(count_batches(path))
+        ]
+        for future in futures:
+            yield future.result()
@@ -0,0 +1,118 @@
+import contextlib
+import functools
+import json
+import os
+import resource
+import sys
+import time
+
+# profiling is off unless the ANALYSIS_PROFILE environment variable is set (e.g.
+# ANALYSIS_PROFILE=1 python analysis/km_plot.py) or enable() is called; when off, stage()
+# and profiled() do nothing beyond checking this flag
+enabled = bool(os.environ.get("ANALYSIS_PROFILE"))
+
+# the stages recorded so far, in the order they finished
+stages = []
+# the stages currently open, innermost last
+_open = []
+_disabled = contextlib.nullcontext()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def _peak_rss():
+    # the process's peak RSS in MB since it was last reset (see _reset_peak_rss), or
+    # over its whole life where that is not available
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _reset_peak_rss():
+    # Linux can reset the peak RSS, so that it can be measured for each stage
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _cpu_time():
+    # CPU time of the process and of the child processes it has waited for (e.g. a
+    # finished process pool)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+@contextlib.contextmanager
+def _stage(name):
+    # peak RSS is reset as each stage starts, so the peak reached so far is carried
+    # over to the stage that encloses it
+    if _open:
+        _open[-1]["peak_rss_mb"] = max(_open[-1]["peak_rss_mb"], _peak_rss())
+    _reset_peak_rss()
+    record = {
+        "stage": "/".join([r["stage"] for r in _open] + [name]),
+        "wall_seconds": 0.0,
+        "cpu_seconds": 0.0,
+        "peak_rss_mb": 0.0,
+    }
+    _open.append(record)
+    wall, cpu = time.perf_counter(), _cpu_time()
+    try:
+        yield record
+    finally:
+        record["wall_seconds"] = time.perf_counter() - wall
+        record["cpu_seconds"] = _cpu_time() - cpu
+        record["peak_rss_mb"] = max(record["peak_rss_mb"], _peak_rss())
+        _open.pop()
+        if _open:
+            _open[-1]["peak_rss_mb"] = max(
+                _open[-1]["peak_rss_mb"], record["peak_rss_mb"]
+            )
+        stages.append(record)
+
+
+def stage(name):
+    # to record the wall time, CPU time and peak RSS of a named stage of a script:
+    #     with stage("read cohort"):
+    #         df = ...
+    # stages can be nested, and are recorded as "outer/inner"
+    if not enabled:
+        return _disabled
+    return _stage(name)
+
+
+def profiled(name=None):
+    # to record each call of a function as a stage (see stage), named after the
+    # function unless name is given
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _stage(name or func.__name__):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def write_profile(output):
+    # to write the stages recorded so far as JSON next to an output, e.g. the profile of
+    # output/figs.svg is output/figs.profile.json; does nothing when profiling is off
+    if not enabled:
+        return None
+    path = os.path.splitext(output)[0] + ".profile.json"
+    with open(path, "w") as f:
+        json.dump({"script": sys.argv[0], "stages": stages}, f, indent=2)
+    return path
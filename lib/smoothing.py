@@ -0,0 +1,62 @@
+import numpy as np
+
+
+def tricube(bandwidth):
+    # the tricube kernel weights of the days -bandwidth..bandwidth, as used by lowess
+    days = np.arange(-bandwidth, bandwidth + 1)
+    return (1 - np.abs(days / (bandwidth + 1)) ** 3) ** 3
+
+
+def stepgrid(times, values, first, last, initial=1.0):
+    # to evaluate a step function (e.g. a KM curve, given at its sorted event times) on
+    # every whole day from first to last: each day takes the value at the last time on
+    # or before it, and days before the first time take initial
+    # (with no times at all, every day takes initial)
+    days = np.arange(first, last + 1)
+    last_time = np.searchsorted(np.asarray(times), days, side="right") - 1
+    grid = np.full(days.size, float(initial))
+    after = last_time >= 0
+    grid[after] = np.asarray(values, dtype=float)[last_time[after]]
+    return days, grid
+
+
+def locallinear(values, bandwidth):
+    # to smooth values on a regular grid with a local-linear kernel regression, with the
+    # tricube kernel of half-width bandwidth: each point is the value at that point of a
+    # weighted straight-line fit to its neighbours, which (unlike a moving average)
+    # keeps the ends of the grid unbiased
+    # the fits are built from sums over each window, all of them computed at once by
+    # convolving with the precomputed kernel, so the cost is O(N * bandwidth)
+    values = np.asarray(values, dtype=float)
+    weights = tricube(bandwidth)
+    offsets = np.arange(-bandwidth, bandwidth + 1)
+    present = np.ones(values.size)
+
+    # window sums of w * u^j (over the points present) and of w * u^j * y, where u is
+    # the offset from the centre; np.convolve reverses the kernel, so it is given reversed
+    def windowsum(x, power):
+        full = np.convolve(x, (weights * offsets**power)[::-1])
+        return full[bandwidth : bandwidth + x.size]
+
+    s0, s1, s2 = [windowsum(present, power) for power in range(3)]
+    t0, t1 = [windowsum(values, power) for power in range(2)]
+    # (a window holding a single point has no slope, so takes its weighted mean)
+    determinant = s0 * s2 - s1**2
+    slope = determinant > 1e-12 * s0 * s2
+    return np.where(
+        slope, (s2 * t0 - s1 * t1) / np.where(slope, determinant, 1.0), t0 / s0
+    )
+
+
+def smoothcurve(times, values, bandwidth, first, last, initial=1.0, monotone=True):
+    # to smooth a step function (e.g. a KM curve) given at its event times onto the days
+    # first..last (see stepgrid), with a local-linear kernel of half-width bandwidth
+    # days (see locallinear)
+    # set monotone to keep a non-increasing curve (e.g. survival) non-increasing after
+    # smoothing, which the end corrections of the local-linear fit can otherwise undo
+    # returns (days, smoothed values)
+    days, grid = stepgrid(times, values, first, last, initial=initial)
+    smoothed = locallinear(grid, bandwidth)
+    if monotone:
+        smoothed = np.minimum.accumulate(smoothed)
+    return days, smoothed
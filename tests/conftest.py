@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the library modules import each other as top-level modules, as the analysis scripts
+# do with sys.path.append("lib/")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bootstrap import CIFbootstrap
+from functions import CIFestimate
+
+
+def test_CIFbootstrap():
+    rng = np.random.default_rng(0)
+    times = rng.integers(0, 40, size=2000)
+    causes = pd.Categorical(
+        rng.choice(["covid", "other", None], size=2000, p=[0.1, 0.2, 0.7]),
+        categories=["covid", "other", "unknown"],
+    )
+
+    curves = CIFestimate(times, causes, horizon=30)
+    limits = CIFbootstrap(times, causes, 30, replicates=100)
+    pd.testing.assert_frame_equal(
+        limits[["outcome", "times"]],
+        curves[["outcome", "times"]],
+        check_dtype=False,
+        check_categorical=False,
+    )
+    assert (limits["lower"] <= curves["kmestimate"] + 1e-12).all()
+    assert (curves["kmestimate"] <= limits["upper"] + 1e-12).all()
+    # a cause with no deaths has no uncertainty
+    unknown = limits[limits["outcome"] == "unknown"]
+    assert (unknown[["lower", "upper"]] == 1).all().all()
+
+    # the replicates are the same however many processes estimate them
+    pd.testing.assert_frame_equal(
+        CIFbootstrap(times, causes, 30, replicates=100, jobs=2), limits
+    )
+
+
+def test_CIFbootstrap_rejects_no_replicates():
+    with pytest.raises(ValueError):
+        CIFbootstrap(np.array([1, 2]), ["covid", None], 10, replicates=0)
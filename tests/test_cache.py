@@ -0,0 +1,54 @@
+import os
+
+import pandas as pd
+
+from cache import cached, digest, evict
+from test_cohort import write_feather
+
+
+def test_cached(tmp_path):
+    source = tmp_path / "input.csv"
+    source.write_text("a")
+    cache_dir = str(tmp_path / "cache")
+    calls = []
+
+    def compute():
+        calls.append(None)
+        return pd.DataFrame({"x": [len(calls)]})
+
+    first = cached("result", [str(source)], compute, cache_dir=cache_dir)
+    again = cached("result", [str(source)], compute, cache_dir=cache_dir)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(again, first)
+
+    # a change to the inputs' contents is a miss; a change to their times is not
+    source.write_text("b")
+    changed = cached("result", [str(source)], compute, cache_dir=cache_dir)
+    assert len(calls) == 2
+    assert changed["x"].tolist() == [2]
+    os.utime(source, (0, 0))
+    cached("result", [str(source)], compute, cache_dir=cache_dir)
+    assert len(calls) == 2
+    assert not [f for f in os.listdir(cache_dir) if f.endswith(".tmp")]
+
+
+def test_evict(tmp_path):
+    for i, name in enumerate(["old", "middle", "new", "writing.tmp"]):
+        path = tmp_path / name
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (i, i))
+
+    evict(str(tmp_path), max_bytes=150)
+    # the least recently used entries go first; entries being written are left alone
+    assert sorted(os.listdir(tmp_path)) == ["new", "writing.tmp"]
+
+
+def test_digest_of_columns(tmp_path):
+    df = pd.DataFrame({"a": [1, 2, 3], "b": [4, 5, 6]})
+    path = str(tmp_path / "data.feather")
+    write_feather(path, df, batch_size=2)
+    before = digest([(path, ["a"])]), digest([(path, ["b"])])
+
+    write_feather(path, df.assign(b=[4, 5, 7]), batch_size=2)
+    assert digest([(path, ["a"])]) == before[0]
+    assert digest([(path, ["b"])]) != before[1]
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from cohort import iter_cohort, read_batch, write_cohort_cache, write_event_table
+from functions import MISSING_DAY
+
+
+def write_feather(path, df, batch_size):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=batch_size):
+                writer.write_batch(batch)
+
+
+def test_event_table_numbers_patients_across_batches(tmp_path):
+    cohort = pd.DataFrame(
+        {
+            "patient_id": [1, 2, 3, 4, 5],
+            "sgss_X1_date": pd.to_datetime(
+                ["2020-02-01", None, "2020-02-03", None, "2020-02-05"]
+            ),
+            "age": [10, 20, 30, 40, 50],
+        }
+    )
+    source, cache, events = [
+        str(tmp_path / name)
+        for name in ["input.feather", "cohort.arrow", "events.feather"]
+    ]
+    write_feather(source, cohort, batch_size=2)
+
+    write_cohort_cache(source, cache, "2020-02-01")
+    cached = pd.concat(iter_cohort(cache), ignore_index=True)
+    assert cached["sgss_X1_date"].tolist() == [0, MISSING_DAY, 2, MISSING_DAY, 4]
+    assert cached["age"].tolist() == cohort["age"].tolist()
+
+    write_event_table(cache, events, "2020-02-01")
+    events = pd.concat(iter_cohort(events), ignore_index=True)
+    assert events["patient_row"].tolist() == [0, 2, 4]
+    assert events["day"].tolist() == [0, 2, 4]
+    np.testing.assert_array_equal(
+        cohort["patient_id"].to_numpy()[events["patient_row"]], [1, 3, 5]
+    )
+
+
+def test_event_table_reads_from_first_day(tmp_path):
+    cohort = pd.DataFrame(
+        {
+            "patient_id": [1, 2, 3],
+            "sgss_X1_date": pd.to_datetime(["2020-02-09", "2020-02-02", "2020-02-05"]),
+            "sgss_X2_date": pd.to_datetime(["2020-02-10", None, "2020-02-07"]),
+        }
+    )
+    source, events = [str(tmp_path / name) for name in ["input.feather", "events"]]
+    write_feather(source, cohort, batch_size=3)
+    write_event_table(source, events, "2020-02-01")
+
+    # each batch is sorted by day
+    assert pd.concat(iter_cohort(events))["day"].tolist() == [1, 4, 6, 8, 9]
+    since = pd.concat(iter_cohort(events, first_day=6), ignore_index=True)
+    assert since["day"].tolist() == [6, 8, 9]
+    assert since["patient_row"].tolist() == [2, 0, 0]
+    assert read_batch(events, 0, columns=["day"], first_day=9)["day"].tolist() == [9]
+    with pytest.raises(ValueError):
+        read_batch(events, 0, columns=["codelist"], first_day=9)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from disclosure import disclosure_control, round_midpoint6, suppress_secondary
+
+
+def suppress_column(column, n):
+    # secondary suppression of one column, one count at a time
+    column = np.array(column, dtype=float)
+    suppressed_count = column[column <= n].sum()
+    if suppressed_count == 0:
+        return np.zeros(column.size, dtype=bool)
+    column[column <= n] = np.nan
+    while suppressed_count <= n and not np.isnan(column).all():
+        smallest = np.nanargmin(column)
+        suppressed_count += column[smallest]
+        column[smallest] = np.nan
+    return np.isnan(column)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_suppress_secondary_matches_column_by_column(seed):
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 12, size=(rng.integers(1, 15), 4))
+
+    expected = np.column_stack(
+        [suppress_column(values[:, j], 5) for j in range(values.shape[1])]
+    )
+    np.testing.assert_array_equal(suppress_secondary(values, 5), expected)
+
+
+def test_suppress_secondary_within_strata():
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 12, size=(60, 3))
+    groups = rng.integers(0, 4, size=60)
+
+    result = suppress_secondary(values, 5, groups=groups)
+    for group in range(4):
+        rows = groups == group
+        expected = np.column_stack(
+            [suppress_column(values[rows, j], 5) for j in range(values.shape[1])]
+        )
+        np.testing.assert_array_equal(result[rows], expected)
+
+
+def test_suppress_secondary_ignores_zero_small_counts():
+    values = np.array([[0], [0], [10], [20]])
+    assert not suppress_secondary(values, 5).any()
+
+
+def test_disclosure_control_rounds_what_is_not_suppressed():
+    df = pd.DataFrame({"stratum": ["a", "a", "b"], "count": [3, 12, 27]})
+    result = disclosure_control(df, n=5, rounding="nearest5", by="stratum")
+    assert result["stratum"].tolist() == ["a", "a", "b"]
+    assert np.isnan(result["count"][0])
+    assert result["count"][1:].tolist() == [10, 25]
+
+
+def test_round_midpoint6():
+    values = np.array([[0, 3, 6, 7, 8, 12, 13, 18, 19]])
+    result = round_midpoint6(values)
+    np.testing.assert_array_equal(
+        result, [[np.nan, np.nan, np.nan, np.nan, 9, 9, 15, 15, 21]]
+    )
+    assert np.isnan(round_midpoint6([np.nan]))[0]
+
+
+def test_disclosure_control_midpoint6():
+    df = pd.DataFrame({"count": [0, 3, 6, 7, 8, 13, 14]})
+    result = disclosure_control(df, n=5, rounding="midpoint6")
+    np.testing.assert_array_equal(
+        result["count"], [np.nan, np.nan, np.nan, np.nan, 9, 15, 15]
+    )
@@ -0,0 +1,22 @@
+import pandas as pd
+import pyarrow as pa
+
+from dummy import read_study_definition, write_dummy_cohort
+
+
+def test_write_dummy_cohort(tmp_path):
+    study = read_study_definition()
+    serial, parallel = [str(tmp_path / name) for name in ["serial", "parallel"]]
+    write_dummy_cohort(study, serial, 1000, chunk_size=300, seed=1)
+    write_dummy_cohort(study, parallel, 1000, chunk_size=300, seed=1, jobs=2)
+
+    # the file is the same for any number of jobs, with no temporary files left
+    with pa.memory_map(serial) as a, pa.memory_map(parallel) as b:
+        assert pa.ipc.open_file(a).read_all().equals(pa.ipc.open_file(b).read_all())
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["parallel", "serial"]
+
+    # dates are read back as datetime64, as from cohortextractor's dummy data
+    df = pd.read_feather(serial)
+    assert df["patient_id"].tolist() == list(range(1000))
+    assert pd.api.types.is_datetime64_dtype(df["date_died_ons"])
+    assert df["date_died_ons"].notna().any()
@@ -0,0 +1,367 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from functions import (
+    MISSING_DAY,
+    CIFestimate,
+    KMestimate,
+    KMestimate_multi,
+    KMestimate_stratified,
+    dayoffsets,
+    episodes,
+    eventcountseries,
+    eventtable,
+    imdband,
+    redact_small_numbers,
+    to_dayoffsets,
+)
+
+
+def test_KMestimate_stratified_matches_KMestimate_per_stratum():
+    rng = np.random.default_rng(0)
+    n = 2000
+    times = rng.integers(0, 50, size=n)
+    indicators = (rng.random(n) < 0.3).astype(int)
+    groups = pd.DataFrame(
+        {
+            # an unused category, and missing values, in a categorical grouped with
+            # another column
+            "region": pd.Categorical(
+                rng.choice(["a", "b", "d", None], size=n),
+                categories=["a", "b", "c", "d"],
+            ),
+            "sex": rng.choice(["F", "M", None], size=n),
+        }
+    )
+
+    result = KMestimate_stratified(times, indicators, groups)
+
+    strata = result[["region", "sex"]].drop_duplicates()
+    assert len(strata) == len(groups.drop_duplicates())
+    for region, sex in strata.itertuples(index=False):
+        rows = (
+            groups["region"].isna() if pd.isna(region) else groups["region"] == region
+        )
+        rows &= groups["sex"].isna() if pd.isna(sex) else groups["sex"] == sex
+        expected = KMestimate(times[rows], indicators[rows])
+        stratum = result.loc[
+            (result["region"].isna() if pd.isna(region) else result["region"] == region)
+            & (result["sex"].isna() if pd.isna(sex) else result["sex"] == sex),
+            expected.columns,
+        ]
+        pd.testing.assert_frame_equal(
+            stratum.reset_index(drop=True), expected, check_dtype=False
+        )
+
+
+def test_KMestimate_stratified_single_variable():
+    times = np.array([1, 2, 3, 4, 5])
+    indicators = np.array([1, 0, 1, 1, 0])
+    groups = pd.Series(["x", "y", "x", None, "y"], name="group")
+
+    result = KMestimate_stratified(times, indicators, groups)
+    assert result["group"][:4].tolist() == ["x", "x", "y", "y"]
+    assert pd.isna(result["group"][4])
+    np.testing.assert_allclose(result["kmestimate"], [0.5, 0.0, 1.0, 1.0, 0.0])
+
+
+def test_KMestimate_multi_matches_KMestimate():
+    rng = np.random.default_rng(1)
+    times = rng.integers(0, 100, size=500)
+    indicators = {"covid": (rng.random(500) < 0.2).astype(int)}
+
+    result = KMestimate_multi(times, indicators)
+    expected = KMestimate(times, indicators["covid"])
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+
+
+def test_KMestimate_multi_horizon_matches_full_estimate():
+    rng = np.random.default_rng(2)
+    times = rng.integers(0, 100, size=1000)
+    indicators = {
+        "covid": (rng.random(1000) < 0.1).astype(int),
+        "other": (rng.random(1000) < 0.2).astype(int),
+    }
+
+    full = KMestimate_multi(times, indicators, ci=0.95)
+    result = KMestimate_multi(times, indicators, horizon=40, ci=0.95)
+    pd.testing.assert_frame_equal(
+        result,
+        full[full["times"] <= 40].reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_KMestimate_multi_horizon_counts_later_times_at_risk():
+    result = KMestimate_multi([1, 2, 50, 60], {"death": [1, 0, 1, 0]}, horizon=10)
+    assert result["times"].tolist() == [1, 2]
+    assert result["atrisk"].tolist() == [4, 3]
+    np.testing.assert_allclose(result["kmestimate"], [0.75, 0.75])
+
+
+def aalen_johansen(times, causes):
+    # cumulative incidence of each cause, one unique time at a time
+    causes = pd.Series(causes)
+    labels = sorted(causes.dropna().unique())
+    survival = 1.0
+    incidence = {cause: 0.0 for cause in labels}
+    curves = {cause: [] for cause in labels}
+    for t in np.unique(times):
+        atrisk = (times >= t).sum()
+        at_t = causes[times == t]
+        died = {cause: (at_t == cause).sum() for cause in labels}
+        for cause in labels:
+            incidence[cause] += survival * died[cause] / atrisk
+            curves[cause].append(incidence[cause])
+        survival *= 1 - sum(died.values()) / atrisk
+    return curves
+
+
+def test_CIFestimate_matches_aalen_johansen():
+    rng = np.random.default_rng(0)
+    times = rng.integers(0, 30, size=500)
+    causes = pd.Series(
+        rng.choice(["covid", "other", None], size=500, p=[0.2, 0.3, 0.5])
+    )
+
+    expected = aalen_johansen(times, causes)
+    result = CIFestimate(times, causes)
+    for cause, curve in expected.items():
+        estimate = result.loc[result["outcome"] == cause, "kmestimate"].to_numpy()
+        np.testing.assert_allclose(1 - estimate, curve)
+
+
+def test_CIFestimate_horizon_matches_full_estimate():
+    rng = np.random.default_rng(1)
+    times = rng.integers(-3, 60, size=400)
+    causes = pd.Series(rng.choice(["covid", "other", None], size=400))
+
+    full = CIFestimate(times, causes)
+    result = CIFestimate(times, causes, horizon=20)
+    pd.testing.assert_frame_equal(
+        result,
+        full[full["times"] <= 20].reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_CIFestimate_keeps_categories_without_deaths():
+    causes = pd.Categorical(
+        ["covid", None, "covid", None], categories=["covid", "other", "unknown"]
+    )
+    result = CIFestimate(np.array([1, 2, 3, 5]), causes, horizon=10)
+
+    assert list(result["outcome"].unique()) == ["covid", "other", "unknown"]
+    other = result[result["outcome"] != "covid"]
+    assert (other["kmestimate"] == 1).all()
+    assert (other["died"] == 0).all()
+
+
+def test_CIFestimate_from_codes():
+    causes = pd.Categorical(
+        ["covid", None, "other", "covid"], categories=["covid", "other", "unknown"]
+    )
+    times = np.array([1, 2, 3, 5])
+    pd.testing.assert_frame_equal(
+        CIFestimate(times, causes.codes, horizon=10, categories=causes.categories),
+        CIFestimate(times, causes, horizon=10),
+    )
+
+
+def test_CIFestimate_all_censored():
+    causes = pd.Categorical([None] * 3, categories=["covid", "other"])
+    result = CIFestimate(np.array([1, 2, 3]), causes, horizon=10)
+    assert (result["kmestimate"] == 1).all()
+
+    result = CIFestimate(np.array([1, 2, 3]), [None] * 3)
+    assert result.empty
+    assert "kmestimate" in result.columns
+
+
+def test_imdband():
+    imd = pd.Series([0, 1, 6568, 6569, 26276, 32844, None])
+    bands = imdband(imd, [1, 6569, 13138, 19707, 26276])
+    assert bands.cat.categories.tolist() == ["1", "2", "3", "4", "5"]
+    assert bands.tolist()[1:6] == ["1", "1", "2", "5", "5"]
+    assert bands.isna().tolist() == [True, False, False, False, False, False, True]
+
+
+@pytest.mark.parametrize("rule", ["D", "W", "M", "2W"])
+def test_eventcountseries_day_offsets_match_dates(rule):
+    date_range = pd.DataFrame(index=pd.date_range("2020-02-01", "2020-08-01"))
+    offsets = pd.Series(np.array([0, 1, 1, 40, 100, MISSING_DAY], dtype=np.int16))
+    dates = pd.Series(
+        pd.to_datetime(
+            ["2020-02-01", "2020-02-02", "2020-02-02", "2020-03-12", "2020-05-11", None]
+        )
+    )
+
+    result = eventcountseries(offsets, date_range, rule=rule)
+    expected = eventcountseries(dates, date_range, rule=rule)
+    assert result.sum() == 5
+    np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy())
+
+
+def test_dayoffsets():
+    dates = pd.Series(pd.to_datetime(["2020-02-01", "2020-01-31", None, "2021-02-01"]))
+    days = dayoffsets(dates, "2020-02-01")
+    assert days.dtype == np.int16
+    assert days.tolist() == [0, -1, MISSING_DAY, 366]
+    # already converted offsets are returned unchanged
+    assert dayoffsets(days, "2020-02-01") is days
+
+
+def test_dayoffsets_rejects_dates_beyond_int16():
+    with pytest.raises(ValueError):
+        dayoffsets(pd.to_datetime(["2200-01-01"]), "2020-02-01")
+
+
+def test_to_dayoffsets_converts_only_date_columns():
+    df = pd.DataFrame({"date": pd.to_datetime(["2020-02-03", None]), "age": [40, 50]})
+    result = to_dayoffsets(df, "2020-02-01")
+    assert result["date"].tolist() == [2, MISSING_DAY]
+    assert result["age"].tolist() == [40, 50]
+    assert pd.api.types.is_datetime64_any_dtype(df["date"])
+
+
+def test_eventtable():
+    df = pd.DataFrame(
+        {
+            "patient_id": [1, 2, 3],
+            "sgss_X1_date": pd.to_datetime(["2020-02-01", None, "2020-02-10"]),
+            "sgss_X2_date": pd.to_datetime(["2020-03-01", None, None]),
+            "covid_X1_date": pd.to_datetime([None, "2020-02-05", None]),
+            "date_died_ons": pd.to_datetime(["2020-04-01", None, None]),
+        }
+    )
+    events = eventtable(df, "2020-02-01", first_row=10)
+
+    assert events["codelist"].cat.categories.tolist() == ["sgss", "covid"]
+    assert events.astype({"codelist": str}).values.tolist() == [
+        [10, "sgss", 1, 0],
+        [12, "sgss", 1, 9],
+        [10, "sgss", 2, 29],
+        [11, "covid", 1, 4],
+    ]
+    assert events.dtypes.tolist() == [np.int32, "category", np.int8, np.int16]
+
+
+def test_eventtable_without_event_columns():
+    events = eventtable(pd.DataFrame({"patient_id": [1]}), "2020-02-01")
+    assert events.empty
+    assert events.columns.tolist() == ["patient_row", "codelist", "occurrence", "day"]
+
+
+def suppress_column(column, n):
+    # the loop redact_small_numbers replaced: suppress counts <= n, then the smallest
+    # remaining counts until more than n has been suppressed
+    column = column.astype(float)
+    suppressed_count = column[column <= n].sum()
+    if suppressed_count > 0:
+        column[column <= n] = np.nan
+        while suppressed_count <= n and column.notna().any():
+            suppressed_count += column.min()
+            column[column.idxmin()] = np.nan
+    return column
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_redact_small_numbers_matches_loop(seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "stratum": rng.choice(["a", "b", None], size=40),
+            "x": rng.integers(0, 12, size=40),
+            "y": rng.integers(0, 12, size=40),
+        }
+    )
+
+    result = redact_small_numbers(df, 5, ["x", "y"])
+    for col in ["x", "y"]:
+        pd.testing.assert_series_equal(
+            result[col], suppress_column(df[col], 5), check_dtype=False
+        )
+
+    result = redact_small_numbers(df, 5, "x", by="stratum")
+    for stratum in ["a", "b", None]:
+        rows = df["stratum"].isna() if stratum is None else df["stratum"] == stratum
+        pd.testing.assert_series_equal(
+            result.loc[rows, "x"], suppress_column(df.loc[rows, "x"], 5)
+        )
+    # the input is left as it was
+    assert df["x"].dtype == np.int64
+
+
+def test_redact_small_numbers_keeps_dtype_when_nothing_suppressed():
+    df = pd.DataFrame({"count": [10, 20, 30]})
+    assert redact_small_numbers(df, 5, "count")["count"].dtype == np.int64
+
+    df = pd.DataFrame({"count": [3, 20, 30]})
+    result = redact_small_numbers(df, 5, "count")
+    assert result["count"].isna().tolist() == [True, True, False]
+
+
+def greedy_episodes(days, min_days):
+    kept = []
+    for day in sorted(days):
+        if not kept or day >= kept[-1] + min_days:
+            kept.append(day)
+    return kept
+
+
+def test_episodes_matches_greedy_rule():
+    rng = np.random.default_rng(3)
+    n = 5000
+    events = pd.DataFrame(
+        {
+            "patient_row": rng.integers(0, 300, size=n).astype(np.int32),
+            "codelist": pd.Categorical(rng.choice(["a", "b", "c"], size=n)),
+            "day": rng.integers(-20, 400, size=n).astype(np.int16),
+        }
+    )
+    events.loc[::50, "day"] = MISSING_DAY
+
+    result = episodes(events, 21)
+
+    expected = []
+    present = events[events["day"] != MISSING_DAY]
+    for (patient, codelist), group in present.groupby(
+        ["patient_row", "codelist"], observed=True
+    ):
+        for occurrence, day in enumerate(greedy_episodes(group["day"], 21), 1):
+            expected.append((patient, codelist, occurrence, day))
+    expected = pd.DataFrame(
+        expected, columns=["patient_row", "codelist", "occurrence", "day"]
+    )
+    expected = expected.sort_values(["patient_row", "codelist", "day"])
+    pd.testing.assert_frame_equal(
+        result.astype({"codelist": str}),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_episodes_is_idempotent():
+    rng = np.random.default_rng(4)
+    events = pd.DataFrame(
+        {
+            "patient_row": rng.integers(0, 50, size=1000).astype(np.int32),
+            "codelist": pd.Categorical(rng.choice(["a", "b"], size=1000)),
+            "day": rng.integers(0, 300, size=1000).astype(np.int16),
+        }
+    )
+    once = episodes(events, 7)
+    pd.testing.assert_frame_equal(episodes(once, 7), once)
+
+
+def test_episodes_rejects_min_days_below_one():
+    events = pd.DataFrame(
+        {
+            "patient_row": np.array([0], dtype=np.int32),
+            "codelist": pd.Categorical(["a"]),
+            "day": np.array([0], dtype=np.int16),
+        }
+    )
+    with pytest.raises(ValueError):
+        episodes(events, 0)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cohort import write_event_table
+from functions import eventtablecounts
+from parallel import map_batches, map_shared
+from test_cohort import write_feather
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_map_shared(jobs):
+    rng = np.random.default_rng(0)
+    tasks = [(rng.random(n), rng.random(n)) for n in [0, 1, 100, 1000]]
+
+    results = map_shared(np.add, tasks, jobs=jobs)
+    assert len(results) == len(tasks)
+    for (x, y), result in zip(tasks, results):
+        np.testing.assert_array_equal(result, x + y)
+
+
+@pytest.mark.parametrize("first_day", [None, 3])
+def test_map_batches_matches_serial(tmp_path, first_day):
+    rng = np.random.default_rng(0)
+    days = pd.Timestamp("2020-02-01") + pd.to_timedelta(rng.integers(0, 10, 50), "D")
+    cohort = pd.DataFrame(
+        {"patient_id": np.arange(50), "sgss_X1_date": days.where(rng.random(50) < 0.7)}
+    )
+    source, events = [str(tmp_path / name) for name in ["input.feather", "events"]]
+    write_feather(source, cohort, batch_size=8)
+    write_event_table(source, events, "2020-02-01")
+    dates = pd.DataFrame(index=pd.date_range("2020-02-01", periods=10))
+
+    serial, parallel = [
+        list(
+            map_batches(
+                eventtablecounts,
+                events,
+                columns=["codelist", "day"],
+                jobs=jobs,
+                first_day=first_day,
+                date_range=dates,
+            )
+        )
+        for jobs in [1, 2]
+    ]
+    assert len(serial) == 7
+    for expected, result in zip(serial, parallel):
+        pd.testing.assert_frame_equal(result, expected)
+    total = sum(counts["sgss"].sum() for counts in serial)
+    expected = (cohort["sgss_X1_date"] >= dates.index[first_day or 0]).sum()
+    assert total == expected
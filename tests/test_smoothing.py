@@ -0,0 +1,53 @@
+import numpy as np
+
+from smoothing import locallinear, smoothcurve, stepgrid, tricube
+
+
+def test_stepgrid():
+    days, grid = stepgrid([2, 4], [0.9, 0.5], first=0, last=5)
+    assert days.tolist() == [0, 1, 2, 3, 4, 5]
+    assert grid.tolist() == [1.0, 1.0, 0.9, 0.9, 0.5, 0.5]
+
+    days, grid = stepgrid([], [], first=0, last=2, initial=0.0)
+    assert grid.tolist() == [0.0, 0.0, 0.0]
+
+
+def test_locallinear_matches_weighted_fit():
+    # each point is the value at its centre of a tricube-weighted least-squares line
+    # fitted to the points of its window that fall on the grid
+    rng = np.random.default_rng(0)
+    values = rng.random(30)
+    bandwidth = 4
+    weights = tricube(bandwidth)
+
+    expected = []
+    for i in range(values.size):
+        offsets = np.arange(-bandwidth, bandwidth + 1)
+        inside = (i + offsets >= 0) & (i + offsets < values.size)
+        fit = np.polyfit(
+            offsets[inside],
+            values[i + offsets[inside]],
+            1,
+            w=np.sqrt(weights[inside]),
+        )
+        expected.append(fit[1])
+    np.testing.assert_allclose(locallinear(values, bandwidth), expected)
+
+
+def test_locallinear_keeps_lines_and_single_points():
+    line = 3 - 0.5 * np.arange(20)
+    np.testing.assert_allclose(locallinear(line, 5), line)
+    np.testing.assert_allclose(locallinear([0.7], 5), [0.7])
+
+
+def test_smoothcurve_is_non_increasing():
+    rng = np.random.default_rng(1)
+    times = np.sort(rng.choice(100, size=30, replace=False))
+    values = np.cumprod(1 - rng.random(30) * 0.1)
+
+    days, smoothed = smoothcurve(times, values, 8, first=0, last=100)
+    assert days.tolist() == list(range(101))
+    assert (np.diff(smoothed) <= 0).all()
+    # with monotone = False, the local-linear fit is returned as it is
+    _, raw = smoothcurve(times, values, 8, first=0, last=100, monotone=False)
+    np.testing.assert_allclose(raw, locallinear(stepgrid(times, values, 0, 100)[1], 8))